@@ -0,0 +1,185 @@
+import heapq
+from collections import deque
+
+import numpy as np
+
+
+class Adjacency:
+    def __init__(self, offsets, indices):
+        self.offsets = offsets
+        self.indices = indices
+
+    @classmethod
+    def from_pairs(cls, size, sources, targets, target_size=None):
+        if target_size is None:
+            target_size = size
+
+        keys = np.sort(np.asarray(sources, dtype=np.int64) * target_size + np.asarray(targets, dtype=np.int64))
+        if len(keys) > 0:
+            keys = keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+        sources = keys // target_size
+        targets = keys % target_size
+
+        offsets = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=size), out=offsets[1:])
+
+        return cls(offsets, targets.astype(np.int32))
+
+    @classmethod
+    def concatenate(cls, adjacencies):
+        offsets = [np.zeros(1, dtype=np.int64)]
+        indices = []
+        node_start = 0
+        edge_start = 0
+        for adjacency in adjacencies:
+            offsets.append(adjacency.offsets[1:] + edge_start)
+            indices.append(adjacency.indices.astype(np.int64) + node_start)
+            node_start += len(adjacency)
+            edge_start += len(adjacency.indices)
+
+        return cls(np.concatenate(offsets), np.concatenate(indices).astype(np.int32))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.indices[self.offsets[index]:self.offsets[index + 1]]
+
+    def degrees(self):
+        return np.diff(self.offsets)
+
+    def gather(self, nodes):
+        return self.expand(nodes)[1]
+
+    def expand(self, nodes):
+        nodes = np.asarray(nodes, dtype=np.int64)
+        starts = self.offsets[nodes]
+        counts = self.offsets[nodes + 1] - starts
+        positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        return np.repeat(np.arange(len(nodes)), counts), self.indices[positions]
+
+    def sources(self):
+        return np.repeat(np.arange(len(self), dtype=np.int32), self.degrees())
+
+    def subgraph(self, nodes):
+        owners, neighbors = self.expand(nodes)
+        local = np.searchsorted(nodes, neighbors)
+        inside = local < len(nodes)
+        inside[inside] = nodes[local[inside]] == neighbors[inside]
+
+        offsets = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(owners[inside], minlength=len(nodes)), out=offsets[1:])
+        return Adjacency(offsets, local[inside].astype(np.int32))
+
+    def distance_fields(self, seeds, passable):
+        seeds = np.atleast_2d(seeds)
+        passable = np.atleast_2d(passable).reshape(-1)
+        size = len(self)
+
+        distances = np.zeros(seeds.shape, dtype=np.int32)
+        nearest = np.full(seeds.shape, -1, dtype=np.int32)
+        flat_distances = distances.reshape(-1)
+        flat_nearest = nearest.reshape(-1)
+
+        frontier = np.flatnonzero(seeds)
+        flat_nearest[frontier] = frontier % size
+
+        steps = 1
+        while len(frontier) > 0:
+            flat_distances[frontier] = steps
+
+            owners, neighbors = self.expand(frontier % size)
+            parents = frontier[owners]
+            candidates = parents - parents % size + neighbors
+            reached = passable[candidates] & (flat_distances[candidates] == 0)
+            candidates = candidates[reached]
+            sources = flat_nearest[parents[reached]]
+
+            order = np.lexsort((sources, candidates))
+            frontier, first = np.unique(candidates[order], return_index=True)
+            flat_nearest[frontier] = sources[order][first]
+            steps += 1
+
+        return distances, nearest
+
+    def priority_flood(self, elevation, outlets):
+        offsets = self.offsets.tolist()
+        indices = self.indices.tolist()
+        elevation = np.asarray(elevation, dtype=np.float64).tolist()
+        filled = list(elevation)
+        receivers = [-1] * len(self)
+        visited = [False] * len(self)
+
+        outlets = np.asarray(outlets, dtype=np.int64).tolist()
+        for outlet in outlets:
+            visited[outlet] = True
+        heap = [(elevation[outlet], outlet) for outlet in outlets]
+        heapq.heapify(heap)
+        pits = deque()
+
+        order = []
+        while heap or pits:
+            if pits:
+                node = pits.popleft()
+                level = filled[node]
+            else:
+                level, node = heapq.heappop(heap)
+            order.append(node)
+
+            for neighbor in indices[offsets[node]:offsets[node + 1]]:
+                if visited[neighbor]:
+                    continue
+                visited[neighbor] = True
+                receivers[neighbor] = node
+                if elevation[neighbor] <= level:
+                    filled[neighbor] = level
+                    pits.append(neighbor)
+                else:
+                    heapq.heappush(heap, (elevation[neighbor], neighbor))
+
+        return np.array(filled), np.array(receivers, dtype=np.int32), np.array(order, dtype=np.int64)
+
+    def accumulate(self, roots, receivers, weights):
+        totals = np.array(weights, dtype=np.float64)
+
+        levels = []
+        frontier = np.asarray(roots, dtype=np.int64)
+        while len(frontier) > 0:
+            levels.append(frontier)
+            frontier = self.gather(frontier)
+
+        for level in reversed(levels[1:]):
+            np.add.at(totals, receivers[level], totals[level])
+        return totals
+
+    def shortest_paths(self, sources, costs, limit=np.inf):
+        offsets = self.offsets.tolist()
+        indices = self.indices.tolist()
+        costs = np.asarray(costs, dtype=np.float64).tolist()
+
+        distances = [np.inf] * len(self)
+        predecessors = [-1] * len(self)
+        origins = [-1] * len(self)
+
+        sources = np.asarray(sources, dtype=np.int64).tolist()
+        for origin, source in enumerate(sources):
+            distances[source] = 0.0
+            origins[source] = origin
+        heap = [(0.0, source) for source in sources]
+        heapq.heapify(heap)
+
+        while heap:
+            distance, node = heapq.heappop(heap)
+            if distance > distances[node]:
+                continue
+
+            for position in range(offsets[node], offsets[node + 1]):
+                neighbor = indices[position]
+                candidate = distance + costs[position]
+                if candidate < distances[neighbor] and candidate <= limit:
+                    distances[neighbor] = candidate
+                    predecessors[neighbor] = node
+                    origins[neighbor] = origins[node]
+                    heapq.heappush(heap, (candidate, neighbor))
+
+        return np.array(distances), np.array(predecessors, dtype=np.int32), np.array(origins, dtype=np.int32)
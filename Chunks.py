@@ -0,0 +1,186 @@
+from collections import OrderedDict
+from math import floor
+
+import numpy as np
+from scipy.spatial import Voronoi
+
+from Geography import GeographyType, NodeData
+from Graph import flatten_regions, polygon_centroids
+from Noise import Noise
+from config import SEED, GRAPH_RELAXATIONS, CHUNK_SIZE, CHUNK_POINTS, CHUNK_HALO, CHUNK_CACHE_SIZE, \
+    CHUNK_POINT_CACHE_SIZE, CHUNK_BUILD_BUDGET, CHUNK_LAND_OCTAVES, CHUNK_LAND_FREQUENCY, CHUNK_LAND_THRESHOLD, \
+    CHUNK_LAND_RELIEF, ELEVATION_OCEAN_WEIGHT, ELEVATION_PERLIN_WEIGHT
+
+
+NEIGHBORHOOD = [(0, 0)] + [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx != 0 or dy != 0]
+
+
+def finite_cells(offsets, vertices):
+    lengths = np.diff(offsets)
+    finite = lengths >= 3
+    finite[finite] = np.minimum.reduceat(vertices, offsets[:-1][finite]) >= 0
+    return finite
+
+
+def select_cells(offsets, vertices, cells):
+    lengths = np.diff(offsets)[cells]
+    selected = np.zeros(len(cells) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=selected[1:])
+    positions = np.repeat(offsets[cells] - selected[:-1], lengths) + np.arange(selected[-1])
+    return selected, vertices[positions]
+
+
+def relax_block(points, iterations):
+    for i in range(iterations):
+        voronoi = Voronoi(points)
+        offsets, vertices = flatten_regions(voronoi, len(points))
+        finite = np.flatnonzero(finite_cells(offsets, vertices))
+        offsets, vertices = select_cells(offsets, vertices, finite)
+
+        points = points.copy()
+        points[finite] = polygon_centroids(voronoi.vertices[vertices], offsets)
+
+    return points
+
+
+class Chunk:
+    def __init__(self, key, region_data, hull_offsets, hull_points):
+        self.key = key
+        self.region_data = region_data
+        self.hull_offsets = hull_offsets
+        self.hull_points = hull_points
+
+    def __len__(self):
+        return len(self.region_data)
+
+    def hull(self, index):
+        return self.hull_points[self.hull_offsets[index]:self.hull_offsets[index + 1]]
+
+
+class ChunkWorld:
+    def __init__(self, seed=SEED, chunk_size=CHUNK_SIZE, chunk_points=CHUNK_POINTS, relaxations=GRAPH_RELAXATIONS,
+                 halo=CHUNK_HALO, cache_size=CHUNK_CACHE_SIZE, point_cache_size=CHUNK_POINT_CACHE_SIZE,
+                 build_budget=CHUNK_BUILD_BUDGET):
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.chunk_points = chunk_points
+        self.relaxations = relaxations
+        self.halo = halo
+        self.cache_size = cache_size
+        self.point_cache_size = point_cache_size
+        self.build_budget = build_budget
+
+        self.noise = Noise.get(seed)
+        self.land_noise = Noise.get(seed, CHUNK_LAND_OCTAVES, CHUNK_LAND_FREQUENCY)
+
+        self.chunks = OrderedDict()
+        self.points = OrderedDict()
+
+    def origin(self, cx, cy):
+        return np.array((cx, cy), dtype=np.float64) * self.chunk_size
+
+    def neighborhood(self, cx, cy, points, margin):
+        origin = self.origin(cx, cy)
+        block = [points(cx, cy)]
+        for dx, dy in NEIGHBORHOOD[1:]:
+            neighbors = points(cx + dx, cy + dy)
+            near = np.all((neighbors >= origin - margin) & (neighbors <= origin + self.chunk_size + margin), axis=1)
+            block.append(neighbors[near])
+        return np.concatenate(block) - origin
+
+    def raw_points(self, cx, cy):
+        random = np.random.RandomState([self.seed & 0xFFFFFFFF, cx & 0xFFFFFFFF, cy & 0xFFFFFFFF])
+        return random.random_sample((self.chunk_points, 2)) * self.chunk_size + self.origin(cx, cy)
+
+    def relaxed_points(self, cx, cy):
+        key = (cx, cy)
+        points = self.points.get(key)
+        if points is None:
+            block = self.neighborhood(cx, cy, self.raw_points, self.halo)
+            points = relax_block(block, self.relaxations)[:self.chunk_points] + self.origin(cx, cy)
+
+            self.points[key] = points
+            while len(self.points) > self.point_cache_size:
+                self.points.popitem(last=False)
+        self.points.move_to_end(key)
+        return points
+
+    def classify(self, locations):
+        continent = self.land_noise.fractal(*locations.T)
+        noise_factor = (self.noise.fractal(*locations.T) + 1) / 2
+        relief = np.clip((continent - CHUNK_LAND_THRESHOLD) / CHUNK_LAND_RELIEF, 0, 1)
+
+        elevation = (noise_factor * ELEVATION_PERLIN_WEIGHT + relief * ELEVATION_OCEAN_WEIGHT) / 2
+        land = continent > CHUNK_LAND_THRESHOLD
+        elevation[~land] = 0.2
+        return land, noise_factor, elevation
+
+    def build_chunk(self, cx, cy):
+        origin = self.origin(cx, cy)
+        points = self.neighborhood(cx, cy, self.relaxed_points, self.halo)
+
+        voronoi = Voronoi(points)
+        offsets, vertices = flatten_regions(voronoi, len(points))
+        finite = finite_cells(offsets, vertices)
+
+        cell_x = voronoi.vertices[vertices, 0]
+        cell_y = voronoi.vertices[vertices, 1]
+        starts = offsets[:-1][finite]
+        drawn = np.zeros(len(points), dtype=bool)
+        drawn[finite] = ((np.minimum.reduceat(cell_x, starts) <= self.chunk_size) &
+                         (np.maximum.reduceat(cell_x, starts) >= 0) &
+                         (np.minimum.reduceat(cell_y, starts) <= self.chunk_size) &
+                         (np.maximum.reduceat(cell_y, starts) >= 0))
+        drawn &= np.all((points >= -self.halo / 2) & (points <= self.chunk_size + self.halo / 2), axis=1)
+        cells = np.flatnonzero(drawn)
+        hull_offsets, hull_vertices = select_cells(offsets, vertices, cells)
+
+        points += origin
+        land, noise_factor, elevation = self.classify(points)
+        ridges = voronoi.ridge_points
+        shore = land[ridges] & ~land[ridges[:, ::-1]]
+        coast = np.zeros(len(points), dtype=bool)
+        coast[ridges[shore]] = True
+
+        data = NodeData(points[cells])
+        data.noise_factor[:] = noise_factor[cells]
+        data.elevation[:] = elevation[cells]
+        data.type[:] = GeographyType.OCEAN.code
+        data.type[land[cells]] = GeographyType.LAND.code
+        data.type[coast[cells]] = GeographyType.COAST.code
+
+        return Chunk((cx, cy), data, hull_offsets, voronoi.vertices[hull_vertices] + origin)
+
+    def get(self, cx, cy):
+        key = (cx, cy)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.chunks[key] = self.build_chunk(cx, cy)
+        self.chunks.move_to_end(key)
+        return chunk
+
+    def chunk_keys(self, left, top, right, bottom):
+        return [(cx, cy) for cx in range(floor(left / self.chunk_size), floor(right / self.chunk_size) + 1)
+                for cy in range(floor(top / self.chunk_size), floor(bottom / self.chunk_size) + 1)]
+
+    def load(self, area, budget=None):
+        if budget is None:
+            budget = self.build_budget
+
+        keys = self.chunk_keys(*area)
+        center = ((area[0] + area[2]) / 2 / self.chunk_size - 0.5, (area[1] + area[3]) / 2 / self.chunk_size - 0.5)
+        missing = sorted((key for key in keys if key not in self.chunks),
+                         key=lambda key: (key[0] - center[0]) ** 2 + (key[1] - center[1]) ** 2)
+        for key in missing[:budget]:
+            self.get(*key)
+
+        loaded = [self.get(*key) for key in keys if key in self.chunks]
+        self.evict(set(keys))
+        return loaded
+
+    def evict(self, keep):
+        for key in list(self.chunks):
+            if len(self.chunks) <= self.cache_size:
+                break
+            if key not in keep:
+                del self.chunks[key]
@@ -0,0 +1,165 @@
+import contextlib
+import os
+import shutil
+import tempfile
+from multiprocessing import Pool
+from time import perf_counter
+
+import numpy as np
+
+from Geography import Geography, GeographyType
+from GraphCache import GraphCache
+from Storage import write_json, read_json
+from config import GRAPH_MAX_POINTS, GRAPH_RELAXATIONS, STARTING_LAND_POS, STARTING_LAND_SIZE, LAND_MASS_CULL_SIZE
+
+
+ENSEMBLE_NODE_FIELDS = (('location', np.float32, (2,)), ('type', np.int8, ()), ('elevation', np.float32, ()),
+                        ('steps_from_ocean', np.int16, ()), ('steps_from_water', np.int16, ()),
+                        ('landmass', np.int32, ()))
+ENSEMBLE_STATS = (('seed', np.int64), ('seconds', np.float64), ('region_count', np.int32),
+                  ('corner_count', np.int32), ('land_mass_count', np.int32), ('land_fraction', np.float64),
+                  ('max_steps_from_ocean', np.int32), ('max_steps_from_water', np.int32))
+
+
+def ensemble_layout(count, max_points):
+    layout = [(name, dtype, (count,)) for name, dtype in ENSEMBLE_STATS]
+    layout.append(('land_mass_sizes', np.int32, (count, max_points // (LAND_MASS_CULL_SIZE + 1) + 1)))
+    for prefix, size in (('region', max_points), ('corner', 2 * max_points)):
+        for name, dtype, shape in ENSEMBLE_NODE_FIELDS:
+            layout.append(('%s_%s' % (prefix, name), dtype, (count, size) + shape))
+    return layout
+
+
+class EnsembleResults:
+    def __init__(self, directory, count, max_points, mode='r'):
+        self.directory = directory
+        self.count = count
+        self.max_points = max_points
+
+        self.arrays = {}
+        for name, dtype, shape in ensemble_layout(count, max_points):
+            path = os.path.join(directory, name + '.npy')
+            if mode == 'w+':
+                self.arrays[name] = np.lib.format.open_memmap(path, 'w+', dtype, shape)
+            else:
+                self.arrays[name] = np.load(path, mmap_mode=mode)
+
+    @classmethod
+    def create(cls, directory, seeds, max_points):
+        os.makedirs(directory, exist_ok=True)
+        write_json(os.path.join(directory, 'header.json'), {'count': len(seeds), 'max_points': max_points})
+        results = cls(directory, len(seeds), max_points, 'w+')
+        results.arrays['seed'][:] = seeds
+        results.flush()
+        return results
+
+    @classmethod
+    def open(cls, directory, mode='r'):
+        header = read_json(os.path.join(directory, 'header.json'))
+        return cls(directory, header['count'], header['max_points'], mode)
+
+    def __len__(self):
+        return self.count
+
+    def flush(self):
+        for array in self.arrays.values():
+            array.flush()
+
+    def store(self, index, geography, seconds):
+        arrays = self.arrays
+        regions = geography.region_data
+        sizes = np.array([land_mass.size for land_mass in geography.land_masses], dtype=np.int64)
+        ranks = np.empty(len(sizes) + 1, dtype=np.int32)
+        ranks[np.argsort(-sizes, kind='stable')] = np.arange(len(sizes))
+        ranks[-1] = -1
+
+        arrays['seconds'][index] = seconds
+        arrays['region_count'][index] = len(regions)
+        arrays['corner_count'][index] = len(geography.corner_data)
+        arrays['land_mass_count'][index] = len(sizes)
+        arrays['land_fraction'][index] = np.count_nonzero(regions.has_type(GeographyType.LAND, GeographyType.COAST)) / \
+            max(len(regions), 1)
+        arrays['max_steps_from_ocean'][index] = regions.steps_from_ocean.max(initial=0)
+        arrays['max_steps_from_water'][index] = regions.steps_from_water.max(initial=0)
+        arrays['land_mass_sizes'][index] = 0
+        arrays['land_mass_sizes'][index, :len(sizes)] = -np.sort(-sizes)
+
+        for prefix, data in (('region', regions), ('corner', geography.corner_data)):
+            for name, dtype, shape in ENSEMBLE_NODE_FIELDS:
+                values = ranks[data.landmass] if name == 'landmass' else getattr(data, name)
+                arrays['%s_%s' % (prefix, name)][index, :len(data)] = values
+
+    def summary(self, index):
+        summary = {name: self.arrays[name][index].item() for name, _ in ENSEMBLE_STATS}
+        summary['land_masses'] = self.arrays['land_mass_sizes'][index, :summary['land_mass_count']].tolist()
+        return summary
+
+    def summaries(self):
+        return [self.summary(index) for index in range(self.count)]
+
+    def best(self, key):
+        return max(range(self.count), key=lambda index: key(self.summary(index)))
+
+    def world(self, index):
+        counts = {'region': int(self.arrays['region_count'][index]), 'corner': int(self.arrays['corner_count'][index])}
+        return {'%s_%s' % (prefix, name): self.arrays['%s_%s' % (prefix, name)][index, :counts[prefix]]
+                for prefix in counts for name, _, _ in ENSEMBLE_NODE_FIELDS}
+
+    def delete(self):
+        self.arrays = {}
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def build_world(task):
+    index, seed, settings, directory = task
+
+    with contextlib.ExitStack() as stack:
+        if not settings['verbose']:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w'))))
+
+        start = perf_counter()
+        geography = Geography(seed, settings['max_points'], settings['relaxations'], starting_land=False,
+                              graph_cache=GraphCache(settings['cache_directory']))
+        for x, y, radius in settings['land']:
+            geography.create_land((x, y), radius)
+        if settings['finalize']:
+            geography.finalize()
+        seconds = perf_counter() - start
+
+    results = EnsembleResults.open(directory, 'r+')
+    results.store(index, geography, seconds)
+    results.flush()
+    return index, seconds
+
+
+class Ensemble:
+    def __init__(self, seeds, max_points=GRAPH_MAX_POINTS, relaxations=GRAPH_RELAXATIONS, land=None, finalize=True,
+                 processes=None, cache_directory=None, verbose=False):
+        if land is None:
+            land = [(STARTING_LAND_POS[0], STARTING_LAND_POS[1], STARTING_LAND_SIZE)]
+
+        self.seeds = [int(seed) for seed in seeds]
+        self.processes = processes
+        self.settings = {
+            'max_points': max_points,
+            'relaxations': relaxations,
+            'land': [tuple(spec) for spec in land],
+            'finalize': finalize,
+            'cache_directory': cache_directory,
+            'verbose': verbose,
+        }
+
+    def run(self, directory=None):
+        if directory is None:
+            directory = tempfile.mkdtemp(prefix='ensemble_')
+
+        EnsembleResults.create(directory, self.seeds, self.settings['max_points'])
+        tasks = [(index, seed, self.settings, directory) for index, seed in enumerate(self.seeds)]
+
+        start = perf_counter()
+        with Pool(self.processes) as pool:
+            for done, (index, seconds) in enumerate(pool.imap_unordered(build_world, tasks), 1):
+                print('World %d/%d (seed %d) built in %.2fs.' % (done, len(tasks), self.seeds[index], seconds))
+        print('Ensemble of %d worlds built in %.2fs.\n' % (len(tasks), perf_counter() - start))
+
+        return EnsembleResults.open(directory)
@@ -1,17 +1,31 @@
+import os
+from collections.abc import Mapping
+from copy import copy
 from enum import Enum
+from time import perf_counter
 
 import numpy as np
-from pygame import Surface, draw, font
-from scipy.spatial import ConvexHull, qhull
-from opensimplex import OpenSimplex
-
-from Graph import Graph
-from config import SEED, MAP_SIZE, LAND_PERLIN_WEIGHT, LAND_RADIAL_WEIGHT, LAND_THRESHOLD, \
-    LAND_CORNER_FACTOR, RANDOM_LAKE_FACTOR, LAND_MASS_CULL_SIZE, STARTING_LAND, STARTING_LAND_POS, STARTING_LAND_SIZE, \
-    DRAW_REGION_OUTLINE, DRAW_CORNERS, REGION_OUTLINE_WIDTH, DRAW_DISTANCE_FROM_OCEAN_CORNERS, \
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+from Adjacency import Adjacency
+from Graph import Graph, Point, order_polygons
+from GraphCache import GraphCache
+from Journal import Journal
+from Noise import Noise
+from Profiling import profiled, tally
+from Storage import write_array, read_array, write_json, read_json
+from config import SEED, MAP_SIZE, GRAPH_MAX_POINTS, GRAPH_RELAXATIONS, GRAPH_RELAXATION_TOLERANCE, \
+    LAND_PERLIN_WEIGHT, LAND_RADIAL_WEIGHT, LAND_THRESHOLD, LAND_CORNER_FACTOR, RANDOM_LAKE_FACTOR, \
+    LAND_MASS_CULL_SIZE, STARTING_LAND, STARTING_LAND_POS, STARTING_LAND_SIZE, \
+    REGION_OUTLINE_WIDTH, DRAW_DISTANCE_FROM_OCEAN_CORNERS, \
     DRAW_DISTANCE_FROM_OCEAN_REGIONS, DRAW_DISTANCE_FROM_WATER_CORNERS, DRAW_DISTANCE_FROM_WATER_REGIONS, \
     DRAW_REGIONS_ELEVATION, DRAW_REGIONS_NORMAL, DRAW_REGIONS_OCEAN_DISTANCE, DRAW_REGIONS_WATER_DISTANCE, \
-    DRAW_REGIONS_ELEVATION_COLORED, DRAW_ELEVATION_ON_REGIONS, ELEVATION_OCEAN_WEIGHT, ELEVATION_PERLIN_WEIGHT
+    DRAW_REGIONS_ELEVATION_COLORED, DRAW_ELEVATION_ON_REGIONS, ELEVATION_OCEAN_WEIGHT, ELEVATION_PERLIN_WEIGHT, \
+    RIVER_MIN_DRAINAGE, MOUNTAIN_REGIONS_PER_RANGE, MOUNTAIN_MAX_RANGES, \
+    MOUNTAIN_MIN_STEPS_FROM_OCEAN, MOUNTAIN_SPACING, MOUNTAIN_RANGE_LENGTH, MOUNTAIN_NOISE_COST, MOUNTAIN_COAST_COST, \
+    MOUNTAIN_ELEVATION
 
 
 class GeographyType(Enum):
@@ -21,188 +35,252 @@ class GeographyType(Enum):
     WATER = (50, 50, 255)
     LAND = (75, 150, 75)
     COAST = (230, 220, 200)
-    MOUNTAIN = (255, 0, 0)
+    MOUNTAIN = (140, 120, 100)
 
+    @property
+    def code(self):
+        return TYPE_CODES[self]
 
-class Corner:
-    def __init__(self, location, index):
-        self.location = location
-        self.index = index
 
-        self.landmass = None
+TYPES = list(GeographyType)
+TYPE_CODES = {t: i for i, t in enumerate(TYPES)}
+TYPE_COLORS = np.array([t.value for t in TYPES], dtype=np.float64)
 
-        self.noise_factor = (OpenSimplex(seed=SEED).noise2d(x=self.location.x, y=self.location.y) + 1) / 2
+DRAWN_ATTRIBUTES = ('type', 'elevation', 'steps_from_ocean', 'steps_from_water', 'downslope', 'flux')
+JOURNALED_ATTRIBUTES = ('type', 'elevation', 'steps_from_ocean', 'nearest_ocean_neighbor', 'steps_from_water',
+                        'nearest_water_neighbor', 'landmass', 'downslope', 'flux')
+SAVED_ATTRIBUTES = ('location', 'noise_factor') + JOURNALED_ATTRIBUTES
+SAVED_ADJACENCIES = ('region_neighbors', 'region_corners', 'corner_neighbors', 'corner_regions')
+LAND_MASS_ATTRIBUTES = ('size', 'max_region_steps_from_ocean', 'max_region_steps_from_water',
+                        'max_corner_steps_from_ocean', 'max_corner_steps_from_water')
 
-        self.neighbors = set()
-        self.regions = set()
+WORLD_FORMAT_VERSION = 2
 
-        self.type = GeographyType.WATER
+DRAW_REGION_LABELS = DRAW_ELEVATION_ON_REGIONS or DRAW_DISTANCE_FROM_OCEAN_REGIONS or DRAW_DISTANCE_FROM_WATER_REGIONS
+DRAW_CORNER_LABELS = DRAW_DISTANCE_FROM_OCEAN_CORNERS or DRAW_DISTANCE_FROM_WATER_CORNERS
 
-        self.elevation = 1
 
-        self.steps_from_ocean = 0
-        self.nearest_ocean_neighbor = None
-        self.steps_from_water = 0
-        self.nearest_water_neighbor = None
+class NodeData:
+    def __init__(self, locations):
+        self.location = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
 
-        self.font = font.SysFont('ariel', 40)
+        size = len(self.location)
+        self.noise_factor = np.zeros(size)
 
-    def infer_land(self):
-        if self.type is not GeographyType.BORDER:
-            for region in self.regions:
-                if region.type in (GeographyType.LAND, GeographyType.COAST):
-                    self.type = GeographyType.LAND
-                    return True
-        return False
+        self.type = np.full(size, GeographyType.WATER.code, dtype=np.int8)
 
-    def draw(self, surface):
-        if DRAW_CORNERS:
-            self.location.draw(surface, color=self.type.value)
+        self.elevation = np.ones(size)
 
-        if DRAW_DISTANCE_FROM_OCEAN_CORNERS and \
-                self.type in (GeographyType.LAND, GeographyType.COAST, GeographyType.WATER):
-            font_surface = self.font.render(str(self.steps_from_ocean), 1, (0, 255, 0))
-            surface.blit(font_surface, (self.location.x - int(font_surface.get_width() / 2),
-                         self.location.y - int(font_surface.get_height() / 2)))
-        elif DRAW_DISTANCE_FROM_WATER_CORNERS and \
-                self.type in (GeographyType.LAND, GeographyType.COAST, GeographyType.WATER):
-            font_surface = self.font.render(str(self.steps_from_water), 1, (0, 255, 0))
-            surface.blit(font_surface, (self.location.x - int(font_surface.get_width() / 2),
-                         self.location.y - int(font_surface.get_height() / 2)))
+        self.steps_from_ocean = np.zeros(size, dtype=np.int32)
+        self.nearest_ocean_neighbor = np.full(size, -1, dtype=np.int32)
+        self.steps_from_water = np.zeros(size, dtype=np.int32)
+        self.nearest_water_neighbor = np.full(size, -1, dtype=np.int32)
 
+        self.landmass = np.full(size, -1, dtype=np.int32)
 
-class Region:
-    def __init__(self, location, index):
-        self.location = location
-        self.index = index
+        self.downslope = np.full(size, -1, dtype=np.int32)
+        self.flux = np.zeros(size)
 
-        self.landmass = None
+    def __len__(self):
+        return len(self.location)
 
-        self.hull = []
-        self.corners = set()
-        self.neighbors = set()
+    def unfinalize(self, indices=slice(None)):
+        types = self.type[indices]
+        types[types == GeographyType.COAST.code] = GeographyType.LAND.code
+        types[types == GeographyType.MOUNTAIN.code] = GeographyType.LAND.code
+        types[types == GeographyType.OCEAN.code] = GeographyType.WATER.code
+        self.type[indices] = types
+        self.elevation[indices] = 1
+        self.steps_from_ocean[indices] = 0
+        self.nearest_ocean_neighbor[indices] = -1
+        self.steps_from_water[indices] = 0
+        self.nearest_water_neighbor[indices] = -1
 
-        self.type = GeographyType.WATER
+    def clear_rivers(self, indices=slice(None)):
+        self.downslope[indices] = -1
+        self.flux[indices] = 0
 
-        self.elevation = 1
+    def has_type(self, *types):
+        return type_mask(self.type, *types)
 
-        self.steps_from_ocean = 0
-        self.nearest_ocean_neighbor = None
-        self.steps_from_water = 0
-        self.nearest_water_neighbor = None
 
-        self.font = font.SysFont('ariel', 60)
+def type_mask(codes, *types):
+    return np.isin(codes, [t.code for t in types])
 
-    def make_hull(self):
-        corner_list = list(self.corners)
 
-        if len(corner_list) >= 3:
-            try:
-                convex_hull = [v for v in ConvexHull([c.location.tuple() for c in corner_list]).vertices]
-            except qhull.QhullError:
-                raise Exception('Regions are too close together, cannot create convex hull to draw polygon. ' +
-                                'Lower the number of initial points entered into the Graph object.')
-        else:
-            return False
-
-        self.hull = [corner_list[i].location.tuple() for i in convex_hull]
-
-        return True
-
-    def infer_land(self):
-        if self.type is not GeographyType.LAND:
-            number_water_corners = 0
-            for corner in self.corners:
-                if corner.type in (GeographyType.WATER, GeographyType.OCEAN) or \
-                                np.random.uniform(0, 1) < RANDOM_LAKE_FACTOR:
-                    number_water_corners += 1
-            if number_water_corners / len(self.corners) < LAND_CORNER_FACTOR:
-                self.type = GeographyType.LAND
-                return True
-            else:
-                for corner in self.corners:
-                    if corner.type is not GeographyType.BORDER:
-                        corner.type = GeographyType.WATER
-        return False
-
-    def infer_ocean(self):
-        if self.type is GeographyType.WATER:
-            for region in self.neighbors:
-                if region.type is GeographyType.OCEAN:
-                    self.type = GeographyType.OCEAN
-                    for corner in self.corners:
-                        if corner.type is GeographyType.WATER:
-                            corner.type = GeographyType.OCEAN
-                        elif corner.type is GeographyType.LAND:
-                            corner.type = GeographyType.COAST
-                    return True
-            else:
-                for corner in self.corners:
-                    if corner.type is GeographyType.BORDER:
-                        self.type = GeographyType.OCEAN
-                        return True
-        return False
-
-    def infer_coast(self):
-        if self.type is GeographyType.LAND:
-            for corner in self.corners:
-                if corner.type is GeographyType.COAST:
-                    self.type = GeographyType.COAST
-                    return True
-        return False
-
-    def infer_elevation(self):
-        for corner in self.corners:
-            self.elevation += corner.elevation
-
-        self.elevation /= int(len(self.corners))
-
-    def draw(self, surface):
-        if DRAW_REGIONS_NORMAL:
-            draw.polygon(surface, self.type.value, self.hull, 0)
-        elif DRAW_REGIONS_ELEVATION:
-            draw.polygon(surface, (max(0, min(255, int(self.elevation * 255))),
-                                   max(0, min(255, int(self.elevation * 255))),
-                                   max(0, min(255, int(self.elevation * 255)))), self.hull, 0)
-        elif DRAW_REGIONS_ELEVATION_COLORED:
-            draw.polygon(surface, (max(0, min(255, int((self.type.value[0] * self.elevation)))),
-                                   max(0, min(255, int((self.type.value[1] * self.elevation)))),
-                                   max(0, min(255, int((self.type.value[2] * self.elevation))))), self.hull, 0)
-        elif DRAW_REGIONS_OCEAN_DISTANCE:
-            draw.polygon(surface, (max(0, min(255, self.steps_from_ocean * 20)),
-                                   max(0, min(255, self.steps_from_ocean * 20)),
-                                   max(0, min(255, self.steps_from_ocean * 20))), self.hull, 0)
-        elif DRAW_REGIONS_WATER_DISTANCE:
-            draw.polygon(surface, (max(0, min(255, self.steps_from_water * 20)),
-                                   max(0, min(255, self.steps_from_water * 20)),
-                                   max(0, min(255, self.steps_from_water * 20))), self.hull, 0)
-
-        if DRAW_REGION_OUTLINE:
-            draw.polygon(surface, (0, 0, 0), self.hull, REGION_OUTLINE_WIDTH)
-
-        if DRAW_ELEVATION_ON_REGIONS and \
-                self.type in (GeographyType.LAND, GeographyType.COAST, GeographyType.WATER):
-            font_surface = self.font.render(str(int(self.elevation * 1000)), 1, (255, 0, 0))
-            surface.blit(font_surface, (self.location.x - int(font_surface.get_width() / 2),
-                         self.location.y - int(font_surface.get_height() / 2)))
-        elif DRAW_DISTANCE_FROM_OCEAN_REGIONS and \
-                self.type in (GeographyType.LAND, GeographyType.COAST, GeographyType.WATER):
-            font_surface = self.font.render(str(self.steps_from_ocean), 1, (255, 0, 0))
-            surface.blit(font_surface, (self.location.x - int(font_surface.get_width() / 2),
-                         self.location.y - int(font_surface.get_height() / 2)))
-        elif DRAW_DISTANCE_FROM_WATER_REGIONS and \
-                self.type in (GeographyType.LAND, GeographyType.COAST, GeographyType.WATER):
-            font_surface = self.font.render(str(self.steps_from_water), 1, (255, 0, 0))
-            surface.blit(font_surface, (self.location.x - int(font_surface.get_width() / 2),
-                                        self.location.y - int(font_surface.get_height() / 2)))
+def journal_arrays(region_data, corner_data, edited):
+    arrays = {'region_edited': edited}
+    for prefix, data in (('region_', region_data), ('corner_', corner_data)):
+        for name in JOURNALED_ATTRIBUTES:
+            arrays[prefix + name] = getattr(data, name)
+    return arrays
 
 
-class LandMass:
-    def __init__(self, starting_region):
-        self.regions = set()
-        self.corners = set()
+def convert_graph(graph):
+    arrays = {'region_location': graph.center_points, 'corner_location': graph.corner_points,
+              'corner_is_border': graph.corner_is_border, 'hull_offsets': graph.hull_offsets,
+              'hull_points': graph.hull_points}
+    for name, adjacency in zip(SAVED_ADJACENCIES, (graph.center_centers, graph.center_corners,
+                                                   graph.corner_corners, graph.corner_centers)):
+        arrays[name + '_offsets'] = adjacency.offsets
+        arrays[name + '_indices'] = adjacency.indices
+    return arrays
+
+
+def region_colors(data, indices=slice(None)):
+    if DRAW_REGIONS_NORMAL:
+        colors = TYPE_COLORS[data.type[indices]]
+    elif DRAW_REGIONS_ELEVATION:
+        colors = np.repeat(data.elevation[indices, None] * 255, 3, axis=1)
+    elif DRAW_REGIONS_ELEVATION_COLORED:
+        colors = TYPE_COLORS[data.type[indices]] * data.elevation[indices, None]
+    elif DRAW_REGIONS_OCEAN_DISTANCE:
+        colors = np.repeat(data.steps_from_ocean[indices, None] * 20.0, 3, axis=1)
+    elif DRAW_REGIONS_WATER_DISTANCE:
+        colors = np.repeat(data.steps_from_water[indices, None] * 20.0, 3, axis=1)
+    else:
+        return None
+
+    return np.clip(np.trunc(colors), 0, 255).astype(np.int32).tolist()
+
+
+class ArrayAttribute:
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, node, owner):
+        if node is None:
+            return self
+        return getattr(node.data, self.name)[node.index].item()
+
+    def __set__(self, node, value):
+        getattr(node.data, self.name)[node.index] = value
+
+
+class TypeAttribute:
+    def __get__(self, node, owner):
+        if node is None:
+            return self
+        return TYPES[node.data.type[node.index]]
+
+    def __set__(self, node, value):
+        node.data.type[node.index] = value.code
+
+
+class LandMassAttribute:
+    def __get__(self, node, owner):
+        if node is None:
+            return self
+        index = node.data.landmass[node.index]
+        return node.geography.land_masses[index] if index >= 0 else None
+
+    def __set__(self, node, value):
+        node.data.landmass[node.index] = value.index if value is not None else -1
+
+
+class NodeList:
+    def __init__(self, adjacency, nodes):
+        self.adjacency = adjacency
+        self.nodes = nodes
+
+    def __get__(self, node, owner):
+        if node is None:
+            return self
+        nodes = getattr(node.geography, self.nodes)
+        return [nodes[i] for i in getattr(node.geography, self.adjacency)[node.index]]
+
+
+class NodeViews(Mapping):
+    def __init__(self, geography, view, size):
+        self.geography = geography
+        self.view = view
+        self.size = size
+        self.views = {}
+
+    def __getitem__(self, index):
+        index = int(index)
+        if index not in self.views:
+            if not 0 <= index < self.size:
+                raise KeyError(index)
+            self.views[index] = self.view(self.geography, index)
+        return self.views[index]
+
+    def __iter__(self):
+        return iter(range(self.size))
+
+    def __len__(self):
+        return self.size
+
+
+class Corner:
+    noise_factor = ArrayAttribute('noise_factor')
+    type = TypeAttribute()
+    elevation = ArrayAttribute('elevation')
+    steps_from_ocean = ArrayAttribute('steps_from_ocean')
+    nearest_ocean_neighbor = ArrayAttribute('nearest_ocean_neighbor')
+    steps_from_water = ArrayAttribute('steps_from_water')
+    nearest_water_neighbor = ArrayAttribute('nearest_water_neighbor')
+    landmass = LandMassAttribute()
+
+    neighbors = NodeList('corner_neighbors', 'corners')
+    regions = NodeList('corner_regions', 'regions')
+
+    def __init__(self, geography, index):
+        self.geography = geography
+        self.data = geography.corner_data
+        self.index = index
+
+    @property
+    def location(self):
+        return Point(*self.data.location[self.index])
+
+    def label(self):
+        if self.type in (GeographyType.LAND, GeographyType.COAST, GeographyType.WATER, GeographyType.MOUNTAIN):
+            if DRAW_DISTANCE_FROM_OCEAN_CORNERS:
+                return str(self.steps_from_ocean)
+            elif DRAW_DISTANCE_FROM_WATER_CORNERS:
+                return str(self.steps_from_water)
+        return None
+
+
+class Region:
+    type = TypeAttribute()
+    elevation = ArrayAttribute('elevation')
+    steps_from_ocean = ArrayAttribute('steps_from_ocean')
+    nearest_ocean_neighbor = ArrayAttribute('nearest_ocean_neighbor')
+    steps_from_water = ArrayAttribute('steps_from_water')
+    nearest_water_neighbor = ArrayAttribute('nearest_water_neighbor')
+    landmass = LandMassAttribute()
+
+    corners = NodeList('region_corners', 'corners')
+    neighbors = NodeList('region_neighbors', 'regions')
+
+    def __init__(self, geography, index):
+        self.geography = geography
+        self.data = geography.region_data
+        self.index = index
 
-        self.regions.add(starting_region)
+        self.hull = geography.region_hull(index)
+
+    @property
+    def location(self):
+        return Point(*self.data.location[self.index])
+
+    def label(self):
+        if self.type in (GeographyType.LAND, GeographyType.COAST, GeographyType.WATER):
+            if DRAW_ELEVATION_ON_REGIONS:
+                return str(int(self.elevation * 1000))
+            elif DRAW_DISTANCE_FROM_OCEAN_REGIONS:
+                return str(self.steps_from_ocean)
+            elif DRAW_DISTANCE_FROM_WATER_REGIONS:
+                return str(self.steps_from_water)
+        return None
+
+
+class LandMass:
+    def __init__(self, geography, index):
+        self.geography = geography
+        self.index = index
 
         self.size = 0
         self.max_region_steps_from_ocean = 0
@@ -212,364 +290,750 @@ class LandMass:
 
         self.surrounding_type = GeographyType.OCEAN
 
-        self.build()
-
-    def build(self):
-        has_regions_left = True
-        while has_regions_left:
-            has_regions_left = False
-            regions_to_add = set()
-            for region in self.regions:
-                for neighbor in region.neighbors:
-                    if neighbor not in self.regions:
-                        if neighbor.type in (GeographyType.WATER, GeographyType.LAND, GeographyType.COAST):
-                            regions_to_add.add(neighbor)
-                            has_regions_left = True
-                        else:
-                            self.surrounding_type = neighbor.type
-            for region in regions_to_add:
-                self.regions.add(region)
-                region.landmass = self
-
-        for region in self.regions:
-            for corner in region.corners:
-                self.corners.add(corner)
-                corner.landmass = self
-
-        self.size = len(self.regions)
-        self.max_region_steps_from_ocean = max([r.steps_from_ocean for r in self.regions])
-        self.max_region_steps_from_water = max([r.steps_from_water for r in self.regions])
-        self.max_corner_steps_from_ocean = max([c.steps_from_ocean for c in self.corners])
-        self.max_corner_steps_from_water = max([c.steps_from_water for c in self.corners])
-
-    def sink(self):
-        for region in self.regions:
-            region.type = self.surrounding_type
-            region.landmass = None
-        for corner in self.corners:
-            if corner.type is not GeographyType.BORDER:
-                corner.type = self.surrounding_type
-            corner.landmass = None
-
-    def dissolve(self):
-        for region in self.regions:
-            region.landmass = None
-        for corner in self.corners:
-            corner.landmass = None
-
-    def draw(self, surface):
-        for corner in self.corners:
-            corner.draw(surface)
-        for region in self.regions:
-            region.draw(surface)
+    def region_indices(self):
+        return np.nonzero(self.geography.region_data.landmass == self.index)[0]
+
+    def corner_indices(self):
+        return np.unique(self.geography.region_corners.gather(self.region_indices()))
+
+    @property
+    def regions(self):
+        return [self.geography.regions[i] for i in self.region_indices()]
+
+    @property
+    def corners(self):
+        return [self.geography.corners[i] for i in self.corner_indices()]
 
 
 class Geography:
-    def __init__(self):
-        np.random.seed(SEED)
+    def __init__(self, seed=SEED, max_points=GRAPH_MAX_POINTS, relaxations=GRAPH_RELAXATIONS,
+                 starting_land=STARTING_LAND, path=None, graph_cache=None):
+        self.seed = seed
+        self.max_points = max_points
+        self.relaxations = relaxations
+
+        self.random = np.random.RandomState(self.seed)
 
         self.regions = {}
         self.corners = {}
-        self.land_masses = set()
-
-        self.surface = Surface((MAP_SIZE, MAP_SIZE))
-
-        self.initialize()
-        if STARTING_LAND:
-            self.create_land(STARTING_LAND_POS, STARTING_LAND_SIZE)
-        self.draw()
+        self.land_masses = []
+
+        self.noise = Noise.get(self.seed)
+        self.graph_cache = GraphCache() if graph_cache is None else graph_cache
+
+        self.region_data = None
+        self.corner_data = None
+
+        self.region_neighbors = None
+        self.region_corners = None
+        self.corner_neighbors = None
+        self.corner_regions = None
+        self.node_neighbors = None
+        self.corner_tree = None
+        self.region_on_border = None
+        self.hull_offsets = None
+        self.hull_points = None
+
+        self.is_finalized = False
+        self.edited = None
+        self.journal = None
+        self.observer = None
+
+        self.drawn_regions = None
+        self.drawn_corners = None
+
+        if path is not None:
+            self.load(path)
+        else:
+            self.initialize()
+            if starting_land:
+                self.create_land(STARTING_LAND_POS, STARTING_LAND_SIZE)
 
+    @profiled('reset')
     def reset(self):
         print('Resetting Land Masses.\n')
-        while len(self.land_masses) > 0:
-            self.land_masses.pop().dissolve()
+        touched = self.journal.restore_initial()
+        self.land_masses = []
+        self.is_finalized = False
+
+        self.journal.record('reset', self.journal_state(), touched)
+
+    def journal_arrays(self):
+        return journal_arrays(self.region_data, self.corner_data, self.edited)
+
+    def pristine_arrays(self):
+        regions = NodeData(self.region_data.location)
+        corners = NodeData(self.corner_data.location)
+        corners.type[self.corner_data.has_type(GeographyType.BORDER)] = GeographyType.BORDER.code
+        return journal_arrays(regions, corners, np.zeros(len(regions), dtype=bool))
+
+    def journal_state(self):
+        return self.is_finalized, [copy(land_mass) for land_mass in self.land_masses]
+
+    def restore_state(self, state):
+        self.is_finalized = state[0]
+        self.land_masses = [copy(land_mass) for land_mass in state[1]]
+
+    def checkpoint(self, stage, fraction):
+        if self.observer is not None:
+            self.observer(stage, fraction)
+
+    def rollback(self):
+        print('Rolling Back Unfinished Changes.\n')
+        self.journal.revert()
+        self.restore_state(self.journal.state)
+
+    @profiled('undo')
+    def undo(self):
+        entry = self.journal.undo()
+        if entry is not None:
+            print('Undoing %s.\n' % entry.label)
+            self.restore_state(entry.before)
+
+    @profiled('redo')
+    def redo(self):
+        entry = self.journal.redo()
+        if entry is not None:
+            print('Redoing %s.\n' % entry.label)
+            self.restore_state(entry.after)
+
+    @profiled('finalize')
+    def finalize(self):
+        print('Finalizing Valid Landmasses.\n')
+        if self.is_finalized:
+            if not self.edited.any():
+                return
+            self.refinalize()
+        else:
+            self.checkpoint('Inferring oceans', 0)
+            self.create_oceans()
+            self.checkpoint('Finding distances', 0.25)
+            self.find_distances()
+            self.checkpoint('Grouping land masses', 0.5)
+            self.create_land_masses()
+            self.create_mountain_ranges()
+            self.checkpoint('Setting elevation', 0.7)
+            self.set_elevation()
+            self.checkpoint('Tracing rivers', 0.85)
+            self.create_rivers()
+        self.checkpoint('Recording', 1)
+
+        self.edited[:] = False
+        self.is_finalized = True
+
+        self.journal.record('finalize', self.journal_state())
+
+    @profiled('refinalize')
+    def refinalize(self):
+        regions = self.region_data
+        corners = self.corner_data
+
+        edited = np.nonzero(self.edited)[0]
+        if len(edited) == 0:
+            return
+        edited = np.union1d(edited, self.region_neighbors.gather(edited))
+
+        self.checkpoint('Checking enclosed oceans', 0)
+        print('Checking Enclosed Oceans.')
+        pockets = self.enclosed_oceans(edited[type_mask(regions.type[edited], GeographyType.OCEAN)])
+        regions.type[pockets] = GeographyType.WATER.code
+
+        self.checkpoint('Collecting edited land masses', 0.2)
+        print('Collecting Edited Land Masses.')
+        affected = self.flood_members(np.union1d(edited, pockets))
+        affected_corners = np.unique(self.region_corners.gather(affected))
+
+        shores = np.union1d(self.corner_regions.gather(affected_corners), edited)
+        shores = shores[type_mask(regions.type[shores], GeographyType.OCEAN)]
+        shore_corners = np.union1d(affected_corners, self.region_corners.gather(shores))
+
+        self.drop_land_masses(regions.landmass[affected])
+        regions.unfinalize(affected)
+        corners.unfinalize(shore_corners)
+        regions.elevation[shores] = 1
+
+        self.infer_shores(shores, affected)
+        self.checkpoint('Finding distances', 0.4)
+        self.find_distances(affected, shore_corners)
+        self.checkpoint('Grouping land masses', 0.6)
+        first_land_mass = len(self.land_masses)
+        self.create_land_masses(affected)
+        self.create_mountain_ranges(np.arange(first_land_mass, len(self.land_masses)))
+        self.checkpoint('Setting elevation', 0.75)
+        self.set_elevation(np.union1d(affected, shores), shore_corners)
+        self.checkpoint('Tracing rivers', 0.9)
+        self.create_rivers(affected_corners)
+        tally(regions=len(affected), corners=len(shore_corners), pockets=len(pockets))
+
+    def enclosed_oceans(self, starts):
+        is_ocean = self.region_data.has_type(GeographyType.OCEAN)
+        visited = np.zeros(len(self.region_data), dtype=bool)
+        escaped = np.zeros(len(self.region_data), dtype=bool)
+
+        pockets = [np.zeros(0, dtype=np.int64)]
+        for start in starts:
+            if visited[start]:
+                continue
+
+            visited[start] = True
+            frontier = np.array([start])
+            members = [frontier]
+            is_open = False
+            while len(frontier) > 0 and not is_open:
+                neighbors = np.unique(self.region_neighbors.gather(frontier))
+                neighbors = neighbors[is_ocean[neighbors]]
+                is_open = self.region_on_border[frontier].any() or escaped[neighbors].any()
+
+                frontier = neighbors[~visited[neighbors]]
+                visited[frontier] = True
+                members.append(frontier)
+
+            members = np.concatenate(members)
+            if is_open:
+                escaped[members] = True
+            else:
+                pockets.append(members)
 
-        for corner in self.corners.values():
-            if corner.type is not GeographyType.BORDER:
-                corner.type = GeographyType.WATER
-        for region in self.regions.values():
-            region.type = GeographyType.WATER
+        return np.concatenate(pockets)
 
-        self.unfinalize()
+    def flood_members(self, seeds):
+        is_member = self.region_data.has_type(GeographyType.WATER, GeographyType.LAND, GeographyType.COAST)
+        visited = np.zeros(len(self.region_data), dtype=bool)
 
-    def finalize(self):
-        print('Finalizing Valid Landmasses.\n')
-        self.create_oceans()
-        self.find_nearest_ocean()
-        self.find_nearest_water()
-        self.create_land_masses()
-        # self.create_mountain_range()
-        self.set_elevation()
+        frontier = seeds[is_member[seeds]]
+        visited[frontier] = True
+        while len(frontier) > 0:
+            neighbors = np.unique(self.region_neighbors.gather(frontier))
+            frontier = neighbors[is_member[neighbors] & ~visited[neighbors]]
+            visited[frontier] = True
+
+        return np.nonzero(visited)[0]
 
+    @profiled('unfinalize')
     def unfinalize(self):
         print('Reverting Finalization.\n')
-        for region in self.regions.values():
-            if region.type is GeographyType.COAST:
-                region.type = GeographyType.LAND
-            if region.type is GeographyType.OCEAN:
-                region.type = GeographyType.WATER
-            region.elevation = 1
-            region.steps_from_ocean = 0
-            region.steps_from_water = 0
-
-        for corner in self.corners.values():
-            if corner.type is GeographyType.COAST:
-                corner.type = GeographyType.LAND
-            if corner.type is GeographyType.OCEAN:
-                corner.type = GeographyType.WATER
-            corner.elevation = 1
-            corner.steps_from_ocean = 0
-            corner.steps_from_water = 0
-
-        while len(self.land_masses) > 0:
-            self.land_masses.pop().dissolve()
+        self.region_data.unfinalize()
+        self.corner_data.unfinalize()
+        self.corner_data.clear_rivers()
+        self.drop_land_masses()
 
-    def initialize(self):
-        graph = Graph()
+        self.is_finalized = False
 
-        print('Converting Graph To Geographical Representation.')
-        for i in graph.corners:
-            self.corners[i] = Corner(graph.corners[i].location, i)
-            if graph.corners[i].is_border:
-                self.corners[i].type = GeographyType.BORDER
+        self.journal.record('unfinalize', self.journal_state())
 
-        for i in graph.centers:
-            self.regions[i] = Region(graph.centers[i].location, i)
+    def drop_land_masses(self, labels=None):
+        if labels is None:
+            self.land_masses = []
+            self.region_data.landmass[:] = -1
+            self.corner_data.landmass[:] = -1
+            return
 
-        for i in graph.corners:
-            for c in graph.corners[i].corners:
-                self.corners[i].neighbors.add(self.corners[c.index])
-            for c in graph.corners[i].centers:
-                self.corners[i].regions.add(self.regions[c.index])
+        kept = np.ones(len(self.land_masses) + 1, dtype=bool)
+        kept[labels] = False
+        kept[-1] = False
+        relabel = np.where(kept, np.cumsum(kept) - 1, -1)
 
-        for i in graph.centers:
-            for c in graph.centers[i].corners:
-                self.regions[i].corners.add(self.corners[c.index])
-            for c in graph.centers[i].centers:
-                self.regions[i].neighbors.add(self.regions[c.index])
+        self.region_data.landmass[:] = relabel[self.region_data.landmass]
+        self.corner_data.landmass[:] = relabel[self.corner_data.landmass]
 
-        for i in self.regions:
-            self.regions[i].make_hull()
+        self.land_masses = [l for l in self.land_masses if kept[l.index]]
+        for index, land_mass in enumerate(self.land_masses):
+            land_mass.index = index
 
-        print('Converted!\n')
+    @profiled('initialize')
+    def initialize(self):
+        start = perf_counter()
+        key = GraphCache.key(self.seed, self.max_points, self.relaxations, GRAPH_RELAXATION_TOLERANCE)
+        arrays = self.graph_cache.load(key)
+        is_cached = arrays is not None
 
+        if not is_cached:
+            arrays = convert_graph(Graph(self.max_points, self.relaxations, seed=self.seed))
+
+        print('Converting Graph To Geographical Representation.')
+        self.region_data = NodeData(arrays['region_location'])
+        self.corner_data = NodeData(arrays['corner_location'])
+
+        self.corner_data.type[arrays['corner_is_border']] = GeographyType.BORDER.code
+        self.corner_data.noise_factor[:] = (self.noise.sample(*self.corner_data.location.T) + 1) / 2
+
+        for name in SAVED_ADJACENCIES:
+            setattr(self, name, Adjacency(arrays[name + '_offsets'], arrays[name + '_indices']))
+        self.hull_offsets = arrays.get('hull_offsets')
+        self.hull_points = arrays.get('hull_points')
+
+        self.edited = np.zeros(len(self.region_data), dtype=bool)
+        self.build_lookups()
+
+        if not is_cached:
+            self.graph_cache.store(key, arrays)
+        tally(regions=len(self.region_data), corners=len(self.corner_data), cached=int(is_cached))
+
+        print('Converted!')
+        print('Graph ready in %.2fs (%s).\n' % (perf_counter() - start, 'cached' if is_cached else 'built'))
+
+    @profiled('build_lookups')
+    def build_lookups(self, initial=None):
+        self.node_neighbors = Adjacency.concatenate((self.region_neighbors, self.corner_neighbors))
+        self.corner_tree = cKDTree(self.corner_data.location)
+        self.region_on_border = np.bincount(self.region_corners.sources(), minlength=len(self.region_data),
+                                            weights=self.corner_data.has_type(GeographyType.BORDER)[
+                                                self.region_corners.indices]) > 0
+        self.journal = Journal(self.journal_arrays(), self.journal_state(), initial)
+
+        self.regions = NodeViews(self, Region, len(self.region_data))
+        self.corners = NodeViews(self, Corner, len(self.corner_data))
+
+    def region_hull(self, index):
+        if self.hull_offsets is None:
+            return []
+        hull = self.hull_points[self.hull_offsets[index]:self.hull_offsets[index + 1]]
+        return [tuple(point) for point in hull.tolist()]
+
+    def graph_arrays(self):
+        if self.hull_offsets is None:
+            self.hull_offsets, self.hull_points = order_polygons(self.region_data.location, self.region_corners,
+                                                                 self.corner_data.location)
+
+        arrays = {'hull_offsets': self.hull_offsets, 'hull_points': self.hull_points}
+        for name in SAVED_ADJACENCIES:
+            arrays[name + '_offsets'] = getattr(self, name).offsets
+            arrays[name + '_indices'] = getattr(self, name).indices
+        return arrays
+
+    @profiled('save')
+    def save(self, path):
+        print('Saving World.')
+        os.makedirs(path, exist_ok=True)
+
+        arrays = self.graph_arrays()
+        arrays['region_edited'] = self.edited
+        for prefix, data in (('region_', self.region_data), ('corner_', self.corner_data)):
+            for name in SAVED_ATTRIBUTES:
+                arrays[prefix + name] = getattr(data, name)
+
+        for name, array in arrays.items():
+            write_array(os.path.join(path, name + '.npy'), array)
+
+        header = {
+            'version': WORLD_FORMAT_VERSION,
+            'seed': self.seed,
+            'max_points': self.max_points,
+            'relaxations': self.relaxations,
+            'map_size': MAP_SIZE,
+            'is_finalized': self.is_finalized,
+            'land_masses': [dict({name: getattr(l, name) for name in LAND_MASS_ATTRIBUTES},
+                                 surrounding_type=l.surrounding_type.name) for l in self.land_masses],
+            'arrays': sorted(arrays),
+        }
+        write_json(os.path.join(path, 'header.json'), header)
+
+        print('Saved!\n')
+
+    @profiled('load')
+    def load(self, path):
+        print('Loading World.')
+        header = read_json(os.path.join(path, 'header.json'))
+        if header.get('version') != WORLD_FORMAT_VERSION:
+            raise Exception('World at %s uses format version %s, but only version %d can be loaded.' %
+                            (path, header.get('version'), WORLD_FORMAT_VERSION))
+        if header['map_size'] != MAP_SIZE:
+            raise Exception('World at %s was generated with MAP_SIZE %s, but MAP_SIZE is %d.' %
+                            (path, header['map_size'], MAP_SIZE))
+
+        arrays = {name: read_array(os.path.join(path, name + '.npy')) for name in header['arrays']}
+
+        self.seed = header['seed']
+        self.max_points = header['max_points']
+        self.relaxations = header['relaxations']
+        self.random = np.random.RandomState(self.seed)
+        self.noise = Noise.get(self.seed)
+
+        self.region_data = NodeData(arrays['region_location'])
+        self.corner_data = NodeData(arrays['corner_location'])
+        for prefix, data in (('region_', self.region_data), ('corner_', self.corner_data)):
+            for name in SAVED_ATTRIBUTES[1:]:
+                setattr(data, name, arrays[prefix + name])
+        for name in SAVED_ADJACENCIES:
+            setattr(self, name, Adjacency(arrays[name + '_offsets'], arrays[name + '_indices']))
+
+        self.edited = arrays['region_edited']
+        self.is_finalized = header['is_finalized']
+        self.land_masses = []
+        for record in header['land_masses']:
+            land_mass = LandMass(self, len(self.land_masses))
+            for name in LAND_MASS_ATTRIBUTES:
+                setattr(land_mass, name, record[name])
+            land_mass.surrounding_type = GeographyType[record['surrounding_type']]
+            self.land_masses.append(land_mass)
+
+        self.hull_offsets = arrays['hull_offsets']
+        self.hull_points = arrays['hull_points']
+        self.build_lookups(self.pristine_arrays())
+
+        print('Loaded!\n')
+
+    @profiled('create_land')
     def create_land(self, origin, max_distance):
-        corners_to_update = set()
-        regions_to_update = set()
+        corners = self.corner_data
+        regions = self.region_data
 
+        self.checkpoint('Assigning land corners', 0)
         print('Assigning Land Corners.')
-        for corner in self.corners.values():
-            distance_from_origin = int(((corner.location.x - origin[0]) ** 2 +
-                                        (corner.location.y - origin[1]) ** 2) ** 0.5)
+        candidates = np.array(self.corner_tree.query_ball_point(origin, np.ceil(max_distance)), dtype=np.int64)
+        distances = np.floor(np.hypot(*(corners.location[candidates] - origin).T))
 
-            if distance_from_origin < max_distance and corner.type is not GeographyType.BORDER:
-                land_factor = ((corner.noise_factor * LAND_PERLIN_WEIGHT) +
-                               (1 - (distance_from_origin / max_distance) * LAND_RADIAL_WEIGHT))
+        in_range = (distances < max_distance) & ~type_mask(corners.type[candidates], GeographyType.BORDER)
+        candidates = candidates[in_range]
+        distances = distances[in_range]
 
-                if land_factor > LAND_THRESHOLD:
-                    corner.type = GeographyType.LAND
-
-                corners_to_update.add(corner)
-
-        for corner in corners_to_update:
-            for region in corner.regions:
-                regions_to_update.add(region)
+        land_factor = (corners.noise_factor[candidates] * LAND_PERLIN_WEIGHT +
+                       (1 - (distances / max_distance) * LAND_RADIAL_WEIGHT))
+        corners.type[candidates[land_factor > LAND_THRESHOLD]] = GeographyType.LAND.code
 
+        self.checkpoint('Inferring land regions', 0.33)
         print('Inferring Land Regions.')
-        for region in regions_to_update:
-            region.infer_land()
-
+        candidate_regions = np.unique(self.corner_regions.gather(candidates))
+        self.edited[candidate_regions] = True
+        candidate_regions = candidate_regions[~type_mask(regions.type[candidate_regions], GeographyType.LAND,
+                                                         GeographyType.COAST)]
+
+        owners, region_corners = self.region_corners.expand(candidate_regions)
+        is_water = type_mask(corners.type[region_corners], GeographyType.WATER, GeographyType.OCEAN) | \
+            (self.random.uniform(0, 1, len(region_corners)) < RANDOM_LAKE_FACTOR)
+        water_fraction = np.bincount(owners, weights=is_water, minlength=len(candidate_regions)) / \
+            np.maximum(self.region_corners.degrees()[candidate_regions], 1)
+
+        is_land = water_fraction < LAND_CORNER_FACTOR
+        regions.type[candidate_regions[is_land]] = GeographyType.LAND.code
+
+        flooded = region_corners[~is_land[owners]]
+        flooded = flooded[~type_mask(corners.type[flooded], GeographyType.BORDER)]
+        corners.type[flooded] = GeographyType.WATER.code
+        self.edited[self.corner_regions.gather(flooded)] = True
+
+        self.checkpoint('Inferring land corners', 0.67)
         print('Inferring Land Corners.\n')
-        for corner in corners_to_update:
-            corner.infer_land()
+        owners, corner_regions = self.corner_regions.expand(candidates)
+        touches_land = np.bincount(owners, weights=type_mask(regions.type[corner_regions], GeographyType.LAND,
+                                                             GeographyType.COAST), minlength=len(candidates)) > 0
+        corners.type[candidates[touches_land]] = GeographyType.LAND.code
+        tally(corners=len(candidates), regions=len(candidate_regions))
 
+        self.journal.record('create_land', self.journal_state())
+
+    @profiled('create_oceans')
     def create_oceans(self):
+        regions = self.region_data
+
         print('Inferring Ocean Regions.')
-        has_regions_left = True
-        while has_regions_left:
-            has_regions_left = False
-            for region in self.regions.values():
-                if region.infer_ocean():
-                    has_regions_left = True
+        is_water = regions.has_type(GeographyType.WATER)
+
+        is_ocean = np.zeros(len(regions), dtype=bool)
+        frontier = np.nonzero((is_water & self.region_on_border) | regions.has_type(GeographyType.OCEAN))[0]
+        levels = 0
+        while len(frontier) > 0:
+            is_ocean[frontier] = True
+            neighbors = np.unique(self.region_neighbors.gather(frontier))
+            frontier = neighbors[is_water[neighbors] & ~is_ocean[neighbors]]
+            levels += 1
+
+        oceans = np.nonzero(is_ocean)[0]
+        regions.type[oceans] = GeographyType.OCEAN.code
+        tally(regions=len(oceans), levels=levels)
 
         print('Inferring Coast Regions.')
-        for region in self.regions.values():
-            region.infer_coast()
+        self.infer_shores(oceans, np.arange(len(regions)))
 
         print('Geography Created!\n')
 
-    def create_land_masses(self):
+    def infer_shores(self, oceans, land):
+        regions = self.region_data
+        corners = self.corner_data
+
+        shore = np.unique(self.region_corners.gather(oceans))
+        shore_types = corners.type[shore]
+        corners.type[shore[shore_types == GeographyType.WATER.code]] = GeographyType.OCEAN.code
+        corners.type[shore[shore_types == GeographyType.LAND.code]] = GeographyType.COAST.code
+
+        owners, land_corners = self.region_corners.expand(land)
+        touches_coast = np.bincount(owners, weights=type_mask(corners.type[land_corners], GeographyType.COAST),
+                                    minlength=len(land)) > 0
+        land = land[type_mask(regions.type[land], GeographyType.LAND) & touches_coast]
+        regions.type[land] = GeographyType.COAST.code
+
+    @profiled('create_land_masses')
+    def create_land_masses(self, nodes=None):
+        regions = self.region_data
+        corners = self.corner_data
+
         print('Grouping Land Masses.')
-        for region in self.regions.values():
-            if region.type in (GeographyType.LAND, GeographyType.COAST, GeographyType.WATER):
-                for land_mass in self.land_masses:
-                    if region in land_mass.regions:
-                        break
-                else:
-                    self.land_masses.add(LandMass(region))
+        if nodes is None:
+            self.drop_land_masses()
+            nodes = np.arange(len(regions))
+        nodes = nodes[type_mask(regions.type[nodes], GeographyType.WATER, GeographyType.LAND, GeographyType.COAST)]
+
+        local = np.full(len(regions), -1, dtype=np.int64)
+        local[nodes] = np.arange(len(nodes))
+        sources, targets = self.region_neighbors.expand(nodes)
+        inside = local[targets] >= 0
+
+        links = csr_matrix((np.ones(np.count_nonzero(inside), dtype=bool), (sources[inside], local[targets[inside]])),
+                           shape=(len(nodes), len(nodes)))
+        count, labels = connected_components(links, directed=False)
+
+        owners, member_corners = self.region_corners.expand(nodes)
+        corner_labels = labels[owners]
+
+        size = np.bincount(labels, minlength=count)
+        aggregates = {}
+        for name, data, members, member_labels in (('region', regions, nodes, labels),
+                                                   ('corner', corners, member_corners, corner_labels)):
+            for field in ('ocean', 'water'):
+                maximum = np.zeros(count, dtype=np.int64)
+                np.maximum.at(maximum, member_labels, getattr(data, 'steps_from_' + field)[members])
+                aggregates['max_%s_steps_from_%s' % (name, field)] = maximum
+
+        surrounding = np.full(count, -1, dtype=np.int64)
+        np.maximum.at(surrounding, labels[sources[~inside]], regions.type[targets[~inside]])
+        surrounding[surrounding < 0] = GeographyType.OCEAN.code
 
         print('Removing Small Land Masses.')
-        land_masses_to_sink = set()
-        for land_mass in self.land_masses:
-            if land_mass.size <= LAND_MASS_CULL_SIZE:
-                land_masses_to_sink.add(land_mass)
-
-        for land_mass in land_masses_to_sink:
-            land_mass.sink()
-            self.land_masses.remove(land_mass)
+        sunk = size <= LAND_MASS_CULL_SIZE
+        regions.type[nodes[sunk[labels]]] = surrounding[labels[sunk[labels]]]
+
+        sunk_corners = sunk[corner_labels] & ~type_mask(corners.type[member_corners], GeographyType.BORDER)
+        corners.type[member_corners[sunk_corners]] = surrounding[corner_labels[sunk_corners]]
+
+        relabel = np.where(sunk, -1, np.cumsum(~sunk) - 1 + len(self.land_masses))
+        regions.landmass[nodes] = relabel[labels]
+        corners.landmass[member_corners] = -1
+        np.maximum.at(corners.landmass, member_corners, relabel[corner_labels])
+
+        for component in np.nonzero(~sunk)[0]:
+            land_mass = LandMass(self, len(self.land_masses))
+            land_mass.size = int(size[component])
+            for name, maximum in aggregates.items():
+                setattr(land_mass, name, int(maximum[component]))
+            land_mass.surrounding_type = TYPES[surrounding[component]]
+            self.land_masses.append(land_mass)
+        tally(regions=len(nodes), components=count, landmasses=int(np.count_nonzero(~sunk)))
 
         print('Land Masses Cleaned Up!\n')
 
-    def find_nearest_ocean(self):
-        print('Finding distance to ocean for regions.')
-        regions_to_check = set()
-        for region in self.regions.values():
-            if region.type is GeographyType.COAST:
-                regions_to_check.add(region)
-
-        steps = 1
-
-        while len(regions_to_check) > 0:
-            new_regions_to_check = set()
-            for region in regions_to_check:
-                if region.steps_from_ocean == 0:
-                    region.steps_from_ocean = steps
-                    for neighbor in region.neighbors:
-                        if neighbor.type in (GeographyType.LAND, GeographyType.WATER):
-                            new_regions_to_check.add(neighbor)
-
-            regions_to_check = new_regions_to_check
-            steps += 1
-
-        print('Finding distance to ocean for corners.')
-        corners_to_check = set()
-        for corner in self.corners.values():
-            if corner.type is GeographyType.COAST:
-                corners_to_check.add(corner)
-
-        steps = 1
-
-        while len(corners_to_check) > 0:
-            new_corners_to_check = set()
-            for corner in corners_to_check:
-                if corner.steps_from_ocean == 0:
-                    corner.steps_from_ocean = steps
-                    for neighbor in corner.neighbors:
-                        if neighbor.type in (GeographyType.LAND, GeographyType.WATER):
-                            new_corners_to_check.add(neighbor)
-
-            corners_to_check = new_corners_to_check
-            steps += 1
-
-    def find_nearest_water(self):
-        print('Finding distance to water for regions.')
-        regions_to_check = set()
-        for region in self.regions.values():
-            if region.type is GeographyType.COAST:
-                regions_to_check.add(region)
-            elif region.type is GeographyType.WATER:
-                for neighbor in region.neighbors:
-                    if neighbor.type is not GeographyType.WATER:
-                        regions_to_check.add(neighbor)
-
-        steps = 1
-
-        while len(regions_to_check) > 0:
-            new_regions_to_check = set()
-            for region in regions_to_check:
-                if region.steps_from_water == 0:
-                    region.steps_from_water = steps
-                    for neighbor in region.neighbors:
-                        if neighbor.type is GeographyType.LAND:
-                            new_regions_to_check.add(neighbor)
-
-            regions_to_check = new_regions_to_check
-            steps += 1
-
-        print('Finding distance to water for corners.')
-        corners_to_check = set()
-        for corner in self.corners.values():
-            if corner.type is GeographyType.COAST:
-                corners_to_check.add(corner)
-            elif corner.type is GeographyType.LAND:
-                for region in corner.regions:
-                    if region.type is GeographyType.WATER:
-                        corners_to_check.add(corner)
-                        break
-
-        steps = 1
-
-        while len(corners_to_check) > 0:
-            new_corners_to_check = set()
-            for corner in corners_to_check:
-                if corner.steps_from_water == 0:
-                    corner.steps_from_water = steps
-                    for neighbor in corner.neighbors:
-                        if neighbor.type is GeographyType.LAND:
-                            new_corners_to_check.add(neighbor)
-
-            corners_to_check = new_corners_to_check
-            steps += 1
-
-    def create_mountain_range(self):
-        largest_landmass = max(self.land_masses, key=lambda l: l.size)
-        iterator = iter(largest_landmass.corners)
-        range_start = next(iterator)
-        range_end = next(iterator)
-        i = 0
-        done = False
-        while not done:
-            range_end = next(iterator)
-            i += 1
-
-            if range_end.type is GeographyType.LAND and i > 10:
-                done = True
-
-        print(range_start.type, range_end.type)
-
-        range_start.type = GeographyType.MOUNTAIN
-        range_end.type = GeographyType.MOUNTAIN
-
-        path = [range_start]
-        indices_visited = set()
-        indices_visited.add(range_start.index)
-
-        done = False
-        while not done:
-            distances = {}
-            for neighbor in path[-1].neighbors:
-                if neighbor.index not in indices_visited:
-                    distance = int((neighbor.location.x - range_end.location.x) ** 2 +
-                                   (neighbor.location.y - range_end.location.y) ** 2)
-                    distances[distance] = neighbor
-                    indices_visited.add(neighbor.index)
-
-            if len(distances) == 0:
-                path.remove(path[-1])
-            else:
-                curr_node = distances[min(distances.keys())]
-                if curr_node == range_end:
-                    done = True
-                else:
-                    curr_node.type = GeographyType.MOUNTAIN
-                    path.append(curr_node)
-
-    def set_elevation(self):
-        for corner in self.corners.values():
-            if corner.type in (GeographyType.OCEAN, GeographyType.BORDER):
-                corner.elevation = 0.2
-            else:
-                corner.elevation = ((corner.noise_factor * ELEVATION_PERLIN_WEIGHT) +
-                                    ((corner.steps_from_ocean / corner.landmass.max_corner_steps_from_ocean) *
-                                     ELEVATION_OCEAN_WEIGHT)) / 2
-
-        for region in self.regions.values():
-            region.infer_elevation()
-
-    def draw(self):
-        print('Drawing.\n')
-        self.surface.fill((0, 0, 0))
-        for region in self.regions.values():
-            region.draw(self.surface)
-        for corner in self.corners.values():
-            corner.draw(self.surface)
+    @profiled('find_distances')
+    def find_distances(self, region_indices=slice(None), corner_indices=slice(None)):
+        regions = self.region_data
+        corners = self.corner_data
+
+        print('Finding distance to ocean and water.')
+        types = np.concatenate((regions.type, corners.type))
+        is_coast = type_mask(types, GeographyType.COAST)
+        is_land = type_mask(types, GeographyType.LAND)
+        is_water = type_mask(types, GeographyType.WATER)
+
+        near_water = np.zeros(len(types), dtype=bool)
+        near_water[self.region_neighbors.gather(np.nonzero(is_water[:len(regions)])[0])] = True
+        near_water[len(regions):] = np.bincount(self.corner_regions.sources(), minlength=len(corners),
+                                                weights=is_water[self.corner_regions.indices]) > 0
+
+        water_seeds = is_coast | (near_water & ~is_water)
+        water_seeds[len(regions):] &= is_coast[len(regions):] | is_land[len(regions):]
+
+        included = np.zeros(len(types), dtype=bool)
+        included[:len(regions)][region_indices] = True
+        included[len(regions):][corner_indices] = True
+
+        distances, nearest = self.node_neighbors.distance_fields(np.stack((is_coast, water_seeds)) & included,
+                                                                 np.stack((is_land | is_water, is_land)) & included)
+        nearest[:, len(regions):] -= len(regions)
+        nearest[nearest < 0] = -1
+        tally(nodes=int(np.count_nonzero(included)), levels=int(distances.max(initial=0)))
+
+        for data, nodes, indices in ((regions, slice(None, len(regions)), region_indices),
+                                     (corners, slice(len(regions), None), corner_indices)):
+            data.steps_from_ocean[indices] = distances[0, nodes][indices]
+            data.nearest_ocean_neighbor[indices] = nearest[0, nodes][indices]
+            data.steps_from_water[indices] = distances[1, nodes][indices]
+            data.nearest_water_neighbor[indices] = nearest[1, nodes][indices]
+
+    def mountain_costs(self, nodes, graph):
+        corners = self.corner_data
+        sources = nodes[graph.sources()]
+        targets = nodes[graph.indices]
+
+        lengths = np.hypot(*(corners.location[targets] - corners.location[sources]).T)
+        factors = 1 + MOUNTAIN_NOISE_COST * (1 - corners.noise_factor[targets]) + \
+            MOUNTAIN_COAST_COST / (1 + corners.steps_from_ocean[targets])
+        return lengths * factors
+
+    def mountain_starts(self, candidates):
+        if len(candidates) == 0:
+            return candidates
+
+        corners = self.corner_data
+        landmass = corners.landmass[candidates]
+        score = corners.noise_factor[candidates]
+
+        cells = np.floor(corners.location[candidates] / MOUNTAIN_SPACING).astype(np.int64)
+        order = np.lexsort((candidates, -score, cells[:, 1], cells[:, 0], landmass))
+        keys = np.stack((landmass, cells[:, 0], cells[:, 1]))[:, order]
+        first = np.concatenate(([True], (keys[:, 1:] != keys[:, :-1]).any(axis=0)))
+        best = order[first]
+
+        order = best[np.lexsort((candidates[best], -score[best], landmass[best]))]
+        groups = landmass[order]
+        group_starts = np.concatenate(([True], groups[1:] != groups[:-1]))
+        ranks = np.arange(len(order)) - np.maximum.accumulate(np.where(group_starts, np.arange(len(order)), 0))
+
+        sizes = np.array([l.size for l in self.land_masses], dtype=np.int64)
+        limits = np.minimum(sizes // MOUNTAIN_REGIONS_PER_RANGE, MOUNTAIN_MAX_RANGES)
+        return candidates[order[ranks < limits[groups]]]
+
+    @profiled('create_mountain_ranges')
+    def create_mountain_ranges(self, land_masses=None):
+        corners = self.corner_data
+
+        print('Raising Mountain Ranges.')
+        if land_masses is None:
+            land_masses = np.arange(len(self.land_masses))
+        selected = np.zeros(len(self.land_masses) + 1, dtype=bool)
+        selected[land_masses] = True
+
+        passable = selected[corners.landmass] & corners.has_type(GeographyType.LAND)
+        candidates = np.nonzero(passable & (corners.steps_from_ocean >= MOUNTAIN_MIN_STEPS_FROM_OCEAN))[0]
+        starts = self.mountain_starts(candidates)
+        if len(starts) == 0:
+            print('No Room For Mountains.\n')
+            return
+
+        nodes = np.nonzero(passable)[0]
+        graph = self.corner_neighbors.subgraph(nodes)
+        _, predecessors, origins = graph.shortest_paths(np.searchsorted(nodes, starts),
+                                                        self.mountain_costs(nodes, graph), MOUNTAIN_RANGE_LENGTH)
+
+        reached = np.nonzero(origins >= 0)[0]
+        spans = np.hypot(*(corners.location[nodes[reached]] - corners.location[starts[origins[reached]]]).T)
+        order = np.lexsort((reached, -spans, origins[reached]))
+        _, first = np.unique(origins[reached][order], return_index=True)
+        ends = reached[order[first]]
+        ends = ends[nodes[ends] != starts[origins[ends]]]
+
+        path = [ends]
+        frontier = ends
+        while len(frontier) > 0:
+            frontier = predecessors[frontier]
+            frontier = frontier[frontier >= 0]
+            path.append(frontier)
+        path = np.unique(np.concatenate(path))
+
+        corners.type[nodes[path]] = GeographyType.MOUNTAIN.code
+        tally(ranges=len(ends), corners=len(path), reached=len(reached))
+
+        print('Mountains Raised!\n')
+
+    @profiled('set_elevation')
+    def set_elevation(self, region_indices=None, corner_indices=slice(None)):
+        corners = self.corner_data
+        regions = self.region_data
+
+        max_steps_from_ocean = np.array([l.max_corner_steps_from_ocean for l in self.land_masses] + [0],
+                                        dtype=np.float64)[corners.landmass[corner_indices]]
+        steps_from_ocean = corners.steps_from_ocean[corner_indices]
+
+        distance_factor = np.divide(steps_from_ocean, max_steps_from_ocean,
+                                    out=np.zeros(len(steps_from_ocean)), where=max_steps_from_ocean > 0)
+        elevation = ((corners.noise_factor[corner_indices] * ELEVATION_PERLIN_WEIGHT) +
+                     (distance_factor * ELEVATION_OCEAN_WEIGHT)) / 2
+        elevation[type_mask(corners.type[corner_indices], GeographyType.MOUNTAIN)] += MOUNTAIN_ELEVATION
+        elevation[type_mask(corners.type[corner_indices], GeographyType.OCEAN, GeographyType.BORDER)] = 0.2
+        corners.elevation[corner_indices] = elevation
+
+        if region_indices is None:
+            region_indices = np.arange(len(regions))
+        owners, region_corners = self.region_corners.expand(region_indices)
+        corner_elevations = np.bincount(owners, weights=corners.elevation[region_corners],
+                                        minlength=len(region_indices))
+        regions.elevation[region_indices] = ((regions.elevation[region_indices] + corner_elevations) /
+                                             np.maximum(self.region_corners.degrees()[region_indices], 1))
+
+    @profiled('create_rivers')
+    def create_rivers(self, corner_indices=slice(None)):
+        corners = self.corner_data
+
+        print('Tracing Rivers.')
+        included = np.zeros(len(corners), dtype=bool)
+        included[corner_indices] = True
+        corners.clear_rivers(included)
+
+        drained = included & corners.has_type(GeographyType.LAND, GeographyType.MOUNTAIN, GeographyType.WATER)
+        outlets = np.nonzero(included & corners.has_type(GeographyType.COAST))[0]
+        nodes = np.union1d(np.nonzero(drained)[0], outlets)
+        roots = np.searchsorted(nodes, outlets)
+        _, receivers, order = self.corner_neighbors.subgraph(nodes).priority_flood(corners.elevation[nodes], roots)
+
+        reached = order[receivers[order] >= 0]
+        tree = Adjacency.from_pairs(len(nodes), receivers[reached], reached)
+        weights = np.zeros(len(nodes))
+        weights[order] = 1 / len(corners)
+        flux = tree.accumulate(roots, receivers, weights)
+
+        corners.downslope[nodes[order]] = np.where(receivers[order] >= 0, nodes[receivers[order]], -1)
+        corners.flux[nodes[order]] = flux[order]
+        tally(corners=len(order), outlets=len(outlets), rivers=len(self.river_edges(nodes[order])[0]))
+
+        print('Rivers Traced!\n')
+
+    def river_edges(self, corner_indices=None):
+        corners = self.corner_data
+        if corner_indices is None:
+            corner_indices = np.arange(len(corners))
+
+        is_river = (corners.downslope[corner_indices] >= 0) & (corners.flux[corner_indices] >= RIVER_MIN_DRAINAGE) & \
+            ~type_mask(corners.type[corner_indices], GeographyType.WATER)
+        sources = corner_indices[is_river]
+        return sources, corners.downslope[sources]
+
+    def mountain_edges(self):
+        is_mountain = self.corner_data.has_type(GeographyType.MOUNTAIN)
+        mountains = np.nonzero(is_mountain)[0]
+        owners, targets = self.corner_neighbors.expand(mountains)
+        sources = mountains[owners]
+
+        is_ridge = is_mountain[targets] & (sources < targets)
+        return sources[is_ridge], targets[is_ridge]
+
+    def mark_drawn(self):
+        self.drawn_regions = {name: getattr(self.region_data, name).copy() for name in DRAWN_ATTRIBUTES}
+        self.drawn_corners = {name: getattr(self.corner_data, name).copy() for name in DRAWN_ATTRIBUTES}
+
+    def changed_regions(self):
+        if self.drawn_regions is None:
+            return np.arange(len(self.region_data))
+
+        regions = np.zeros(len(self.region_data), dtype=bool)
+        corners = np.zeros(len(self.corner_data), dtype=bool)
+        for name in DRAWN_ATTRIBUTES:
+            regions |= getattr(self.region_data, name) != self.drawn_regions[name]
+            corners |= getattr(self.corner_data, name) != self.drawn_corners[name]
+        regions[self.corner_regions.gather(np.nonzero(corners)[0])] = True
+
+        return np.nonzero(regions)[0]
+
+    def region_area(self, regions):
+        selected = np.zeros(len(self.region_data), dtype=bool)
+        selected[regions] = True
+        points = self.hull_points[np.repeat(selected, np.diff(self.hull_offsets))]
+        if len(points) == 0:
+            return None
+
+        return (float(points[:, 0].min()) - REGION_OUTLINE_WIDTH, float(points[:, 1].min()) - REGION_OUTLINE_WIDTH,
+                float(points[:, 0].max()) + REGION_OUTLINE_WIDTH, float(points[:, 1].max()) + REGION_OUTLINE_WIDTH)
+
+    def take_changes(self):
+        regions = self.changed_regions()
+        self.mark_drawn()
+
+        if len(regions) == 0:
+            return regions, None
+        return regions, self.region_area(np.union1d(regions, self.region_neighbors.gather(regions)))
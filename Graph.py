@@ -1,8 +1,11 @@
+from itertools import chain
+
 import numpy as np
-from pygame import draw, Surface
 from scipy.spatial import Voronoi
 
-from config import MAP_SIZE, GRAPH_MAX_POINTS, GRAPH_RELAXATIONS, POINT_RADIUS
+from Adjacency import Adjacency
+from Profiling import profile, profiled, tally
+from config import SEED, MAP_SIZE, GRAPH_MAX_POINTS, GRAPH_RELAXATIONS, GRAPH_RELAXATION_TOLERANCE, POINT_RADIUS
 
 
 class Point:
@@ -14,216 +17,171 @@ class Point:
         return int(self.x), int(self.y)
 
     def draw(self, surface, color=(0, 0, 0)):
-        draw.circle(surface, color, self.tuple(), POINT_RADIUS)
-
-
-class Edge:
-    def __init__(self, index, start_center, end_center, start_corner, end_corner):
-        self.index = index
-
-        self.start_corner = start_corner
-        self.end_corner = end_corner
-        self.start_center = start_center
-        self.end_center = end_center
+        from pygame import draw
 
-        self.has_center_edge = True
-
-        self.start_center.edges.add(self)
-        self.end_center.edges.add(self)
+        draw.circle(surface, color, self.tuple(), POINT_RADIUS)
 
-        self.start_corner.edges.add(self)
-        self.end_corner.edges.add(self)
 
-        self.start_center.centers.add(self.end_center)
-        self.end_center.centers.add(self.start_center)
+@profiled('polygons')
+def order_polygons(centers, center_corners, corners):
+    owners = center_corners.sources()
+    vertices = corners[center_corners.indices]
+    angles = np.arctan2(vertices[:, 1] - centers[owners, 1], vertices[:, 0] - centers[owners, 0])
+    return center_corners.offsets.copy(), vertices[np.lexsort((angles, owners))]
 
-        self.start_center.corners.add(self.start_corner)
-        self.start_center.corners.add(self.end_corner)
 
-        self.end_center.corners.add(self.start_corner)
-        self.end_center.corners.add(self.end_corner)
+def mirror_points(points, margin):
+    mirrored = [points]
+    for axis in (0, 1):
+        for edge in (0, 1):
+            near_edge = points[np.abs(points[:, axis] - edge) < margin]
+            near_edge[:, axis] = 2 * edge - near_edge[:, axis]
+            mirrored.append(near_edge)
 
-        self.start_corner.corners.add(self.end_corner)
-        self.end_corner.corners.add(self.start_corner)
+    return np.concatenate(mirrored)
 
-        self.start_corner.centers.add(self.start_center)
-        self.start_corner.centers.add(self.end_center)
 
-        self.end_corner.centers.add(self.start_center)
-        self.end_corner.centers.add(self.end_center)
+def flatten_regions(voronoi, point_count):
+    regions = [voronoi.regions[r] for r in voronoi.point_region[:point_count]]
 
-    def delete(self, edge_set):
-        self.start_center.edges.remove(self)
-        self.end_center.edges.remove(self)
-        self.start_corner.edges.remove(self)
-        self.end_corner.edges.remove(self)
-        edge_set.remove(self)
+    offsets = np.zeros(point_count + 1, dtype=np.int64)
+    np.cumsum([len(r) for r in regions], out=offsets[1:])
+    vertices = np.fromiter(chain.from_iterable(regions), dtype=np.int64, count=offsets[-1])
 
-    def draw_centers_edge(self, surface, color=(255, 0, 0)):
-        if self.has_center_edge:
-            draw.line(surface, color, self.start_center.location.tuple(), self.end_center.location.tuple(), 1)
+    return offsets, vertices
 
-    def draw_corners_edge(self, surface, color=(0, 0, 0)):
-        draw.line(surface, color, self.start_corner.location.tuple(), self.end_corner.location.tuple(), 1)
 
+def polygon_centroids(vertices, offsets):
+    x = vertices[:, 0]
+    y = vertices[:, 1]
 
-class Center:
-    def __init__(self, location, index):
-        self.location = location
-        self.index = index
+    following = np.arange(1, len(vertices) + 1)
+    following[offsets[1:] - 1] = offsets[:-1]
 
-        self.centers = set()
-        self.edges = set()
-        self.corners = set()
+    cross = x * y[following] - x[following] * y
+    area = np.add.reduceat(cross, offsets[:-1]) * 3
 
-    def delete(self, center_set):
-        for center in self.centers:
-            center.centers.remove(self)
-        for corner in self.corners:
-            corner.centers.remove(self)
-        for edge in self.edges:
-            edge.has_region_edge = False
-        center_set.remove(self)
+    return np.column_stack((np.add.reduceat((x + x[following]) * cross, offsets[:-1]) / area,
+                            np.add.reduceat((y + y[following]) * cross, offsets[:-1]) / area))
 
-    def draw(self, surface, color=(0, 0, 0)):
-        self.location.draw(surface, color)
 
+def clipped_voronoi(points):
+    margin = 4 / np.sqrt(len(points))
+    while True:
+        voronoi = Voronoi(mirror_points(points, margin))
+        offsets, vertices = flatten_regions(voronoi, len(points))
+        if margin >= 1 or (np.all(vertices >= 0) and np.all(np.abs(voronoi.vertices[vertices] - 0.5) <= 0.5 + 1e-9)):
+            return voronoi, offsets, vertices
+        margin *= 2
 
-class Corner:
-    def __init__(self, location, index):
-        self.location = location
-        self.index = index
 
-        self.out_of_bounds = False
-        self.is_border = False
+@profiled('relaxation')
+def relax_points(points, iterations, tolerance=0):
+    for i in range(iterations):
+        print('Performing Relaxation #', i + 1, '.', sep='')
+        voronoi, offsets, vertices = clipped_voronoi(points)
+        centroids = polygon_centroids(voronoi.vertices[vertices], offsets)
 
-        self.centers = set()
-        self.edges = set()
-        self.corners = set()
+        movement = np.abs(centroids - points).max() * MAP_SIZE
+        points = centroids
+        if movement < tolerance:
+            print('Relaxation Converged.')
+            break
 
-        self.infer_out_of_bounds()
+    tally(points=len(points), iterations=i + 1 if iterations > 0 else 0)
 
-    def infer_out_of_bounds(self):
-        if self.location.x < 0 or self.location.y < 0 or self.location.x > MAP_SIZE or self.location.y > MAP_SIZE:
-            self.out_of_bounds = True
-
-    def delete(self, corner_set):
-        for center in self.centers:
-            center.corners.remove(self)
-        for corner in self.corners:
-            corner.corners.remove(self)
-        corner_set.remove(self)
-
-    def draw(self, surface, color=(0, 0, 0)):
-        self.location.draw(surface, color)
+    return points
 
 
 class Graph:
-    def __init__(self):
-        self.surface = Surface((MAP_SIZE, MAP_SIZE))
-        self.surface.fill((255, 255, 255))
-
-        self.centers = {}
-        self.edges = {}
-        self.corners = {}
+    def __init__(self, max_points=GRAPH_MAX_POINTS, relaxations=GRAPH_RELAXATIONS,
+                 relaxation_tolerance=GRAPH_RELAXATION_TOLERANCE, seed=SEED):
+        self.max_points = max_points
+        self.relaxations = relaxations
+        self.relaxation_tolerance = relaxation_tolerance
+        self.random = np.random.RandomState(seed)
 
         self.initialize_centers()
-        self.draw()
 
+    @profiled('graph')
     def initialize_centers(self):
-        centers = []
-        edges = []
-        corners = []
-
         print('Creating Initial Diagram.')
-        voronoi = Voronoi(np.random.rand(GRAPH_MAX_POINTS, 2))
-        for i in range(GRAPH_RELAXATIONS):
-            print('Performing Relaxation #', i + 1, '.', sep='')
-            centroids = []
-            for region in voronoi.regions:
-                if len(region) > 0:
-                    centroids.append((sum([voronoi.vertices[v][0] for v in region]) / len(region),
-                                      sum([voronoi.vertices[v][1] for v in region]) / len(region)))
-            voronoi = Voronoi(centroids)
-
-        print('Converting to Internal Representation.')
-        for point in voronoi.points:
-            centers.append(Center(Point(point[0] * MAP_SIZE, point[1] * MAP_SIZE), len(centers)))
-
-        for vertex in voronoi.vertices:
-            corners.append(Corner(Point(vertex[0] * MAP_SIZE, vertex[1] * MAP_SIZE), len(corners)))
-
-        for i in range(len(voronoi.ridge_points)):
-            if -1 not in voronoi.ridge_points[i] and -1 not in voronoi.ridge_vertices[i]:
-                center_start = centers[voronoi.ridge_points[i][0]]
-                center_end = centers[voronoi.ridge_points[i][1]]
-                corner_start = corners[voronoi.ridge_vertices[i][0]]
-                corner_end = corners[voronoi.ridge_vertices[i][1]]
-                edges.append(Edge(len(edges), center_start, center_end, corner_start, corner_end))
-
-        centers = set(centers)
-        edges = set(edges)
-        corners = set(corners)
+        points = relax_points(self.random.rand(self.max_points, 2), self.relaxations, self.relaxation_tolerance)
+        with profile('voronoi'):
+            voronoi = Voronoi(points)
 
         print('Removing Out Of Bounds Regions.')
-        centers_to_remove = []
-        for center in centers:
-            out_of_bounds = False
-            for corner in center.corners:
-                if corner.out_of_bounds:
-                    out_of_bounds = True
-                    break
-            if out_of_bounds or len(center.edges) < 3:
-                centers_to_remove.append(center)
-
-        for center in centers_to_remove:
-            for corner in center.corners:
-                corner.is_border = True
-            center.delete(centers)
+        center_points = voronoi.points * MAP_SIZE
+        corner_points = voronoi.vertices * MAP_SIZE
+        center_count = len(center_points)
+        corner_count = len(corner_points)
 
-        print('Removing Out Of Bounds Edges.')
-        edges_to_remove = []
-        for edge in edges:
-            if edge.start_corner.out_of_bounds or edge.end_corner.out_of_bounds or \
-                    (edge.start_center not in centers and edge.end_center not in centers):
-                edges_to_remove.append(edge)
+        out_of_bounds = np.any((corner_points < 0) | (corner_points > MAP_SIZE), axis=1)
+
+        ridge_vertices = np.asarray(voronoi.ridge_vertices, dtype=np.int64).reshape(-1, 2)
+        finite = np.all(ridge_vertices >= 0, axis=1) & np.all(voronoi.ridge_points >= 0, axis=1)
+        edge_centers = voronoi.ridge_points[finite].astype(np.int64)
+        edge_corners = ridge_vertices[finite]
 
-        for edge in edges_to_remove:
-            edge.delete(edges)
+        sources = np.repeat(edge_centers, 2, axis=1).ravel()
+        targets = np.tile(edge_corners, 2).ravel()
+        center_out_of_bounds = np.bincount(sources, weights=out_of_bounds[targets], minlength=center_count) > 0
+        edge_counts = np.bincount(edge_centers.ravel(), minlength=center_count)
+        center_removed = center_out_of_bounds | (edge_counts < 3)
+
+        corner_is_border = np.zeros(corner_count, dtype=bool)
+        corner_is_border[targets[center_removed[sources]]] = True
+
+        print('Removing Out Of Bounds Edges.')
+        edge_kept = ~(out_of_bounds[edge_corners].any(axis=1) | center_removed[edge_centers].all(axis=1))
 
         print('Removing Out Of Bounds Corners.')
-        corners_to_remove = []
-        for corner in corners:
-            if corner.out_of_bounds:
-                has_in_bounds_region = False
-                for center in corner.centers:
-                    if center in centers:
-                        has_in_bounds_region = True
-                        break
-                if not has_in_bounds_region:
-                    corners_to_remove.append(corner)
-            else:
-                has_connected_edge = False
-                for edge in corner.edges:
-                    if edge in edges:
-                        has_connected_edge = True
-                        break
-                if not has_connected_edge:
-                    corners_to_remove.append(corner)
-
-        for corner in corners_to_remove:
-            corner.delete(corners)
-
-        self.centers = {c.index: c for c in centers}
-        self.edges = {e.index: e for e in edges}
-        self.corners = {c.index: c for c in corners}
+        corner_kept = ~out_of_bounds & (np.bincount(edge_corners[edge_kept].ravel(), minlength=corner_count) > 0)
+        center_kept = ~center_removed
+
+        print('Compacting Graph.')
+        center_ids = np.full(center_count, -1, dtype=np.int64)
+        center_ids[center_kept] = np.arange(np.count_nonzero(center_kept))
+        corner_ids = np.full(corner_count, -1, dtype=np.int64)
+        corner_ids[corner_kept] = np.arange(np.count_nonzero(corner_kept))
+
+        self.center_points = center_points[center_kept]
+        self.corner_points = corner_points[corner_kept]
+        self.corner_is_border = corner_is_border[corner_kept]
+
+        self.edge_centers = center_ids[edge_centers[edge_kept]].astype(np.int32).reshape(-1, 2)
+        self.edge_corners = corner_ids[edge_corners[edge_kept]].astype(np.int32).reshape(-1, 2)
+
+        centers = center_ids[edge_centers]
+        corners = corner_ids[edge_corners]
+        linked = np.all(centers >= 0, axis=1)
+        self.center_centers = Adjacency.from_pairs(len(self.center_points), centers[linked].ravel(),
+                                                   centers[linked][:, ::-1].ravel())
+        linked = np.all(corners >= 0, axis=1)
+        self.corner_corners = Adjacency.from_pairs(len(self.corner_points), corners[linked].ravel(),
+                                                   corners[linked][:, ::-1].ravel())
+
+        centers = center_ids[sources]
+        corners = corner_ids[targets]
+        linked = (centers >= 0) & (corners >= 0)
+        self.center_corners = Adjacency.from_pairs(len(self.center_points), centers[linked], corners[linked],
+                                                   len(self.corner_points))
+        self.corner_centers = Adjacency.from_pairs(len(self.corner_points), corners[linked], centers[linked],
+                                                   len(self.center_points))
+
+        self.hull_offsets, self.hull_points = order_polygons(self.center_points, self.center_corners,
+                                                             self.corner_points)
+        tally(regions=len(self.center_points), corners=len(self.corner_points), edges=len(self.edge_corners))
 
         print('Graph Creation Successful!\n')
 
-    def draw(self):
-        for edge in self.edges.values():
-            edge.draw_corners_edge(self.surface)
-        for center in self.centers.values():
-            center.draw(self.surface)
-        for corner in self.corners.values():
-            corner.draw(self.surface)
+    def draw(self, surface):
+        from pygame import draw
+
+        for start, end in self.edge_corners:
+            draw.line(surface, (0, 0, 0), Point(*self.corner_points[start]).tuple(),
+                      Point(*self.corner_points[end]).tuple(), 1)
+        for point in self.center_points:
+            Point(*point).draw(surface)
+        for point in self.corner_points:
+            Point(*point).draw(surface)
@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from Storage import write_array, read_array, write_json, read_json, directory_size
+from config import MAP_SIZE, GRAPH_CACHE_DIR, GRAPH_CACHE_MAX_BYTES, GRAPH_CACHE_STAGING_MAX_AGE
+
+
+GRAPH_CACHE_VERSION = 2
+
+
+class GraphCache:
+    def __init__(self, directory=GRAPH_CACHE_DIR, max_bytes=GRAPH_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(seed, max_points, relaxations, relaxation_tolerance):
+        parameters = {
+            'version': GRAPH_CACHE_VERSION,
+            'seed': seed,
+            'max_points': max_points,
+            'relaxations': relaxations,
+            'relaxation_tolerance': relaxation_tolerance,
+            'map_size': MAP_SIZE,
+        }
+        return hashlib.sha256(json.dumps(parameters, sort_keys=True).encode()).hexdigest()[:24]
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def load(self, key):
+        if self.directory is None or not os.path.isfile(os.path.join(self.path(key), 'header.json')):
+            return None
+
+        try:
+            header = read_json(os.path.join(self.path(key), 'header.json'))
+            if header.get('version') != GRAPH_CACHE_VERSION:
+                return None
+
+            os.utime(self.path(key))
+            return {name: read_array(os.path.join(self.path(key), name + '.npy')) for name in header['arrays']}
+        except (OSError, ValueError):
+            return None
+
+    def store(self, key, arrays):
+        if self.directory is None:
+            return
+
+        staging = self.path(key) + '.%d.tmp' % os.getpid()
+        os.makedirs(staging, exist_ok=True)
+        for name, array in arrays.items():
+            write_array(os.path.join(staging, name + '.npy'), array)
+        write_json(os.path.join(staging, 'header.json'), {'version': GRAPH_CACHE_VERSION, 'arrays': sorted(arrays)})
+
+        try:
+            os.rename(staging, self.path(key))
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        newest = float('inf')
+        if keep is not None:
+            try:
+                newest = os.stat(self.path(keep)).st_mtime
+            except OSError:
+                pass
+
+        stale = time.time() - GRAPH_CACHE_STAGING_MAX_AGE
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir():
+                continue
+            try:
+                if entry.name.endswith('.tmp'):
+                    if entry.stat().st_mtime < stale:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                    continue
+                entries.append((entry.stat().st_mtime, entry.name, directory_size(entry.path)))
+            except OSError:
+                continue
+
+        total = sum(size for _, _, size in entries)
+        for mtime, name, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name != keep and mtime < newest:
+                shutil.rmtree(self.path(name), ignore_errors=True)
+                total -= size
@@ -0,0 +1,126 @@
+import numpy as np
+
+from Profiling import profiled, tally
+from config import JOURNAL_DEPTH, JOURNAL_MAX_BYTES
+
+
+class JournalEntry:
+    def __init__(self, label, changes, before, after):
+        self.label = label
+        self.changes = changes
+        self.before = before
+        self.after = after
+
+    @property
+    def nbytes(self):
+        return sum(sum(array.nbytes for array in change) for change in self.changes.values())
+
+    def apply(self, arrays, undo=False):
+        for name, (indices, old, new) in self.changes.items():
+            arrays[name][indices] = old if undo else new
+
+    def coalesce(self, later):
+        changes = {}
+        for name in set(self.changes) | set(later.changes):
+            first = self.changes.get(name)
+            second = later.changes.get(name)
+            if first is None or second is None:
+                changes[name] = first if second is None else second
+                continue
+
+            indices = np.union1d(first[0], second[0])
+            first_positions = np.searchsorted(indices, first[0])
+            second_positions = np.searchsorted(indices, second[0])
+
+            old = np.empty(len(indices), dtype=first[1].dtype)
+            old[second_positions] = second[1]
+            old[first_positions] = first[1]
+            new = np.empty(len(indices), dtype=first[2].dtype)
+            new[first_positions] = first[2]
+            new[second_positions] = second[2]
+
+            changed = old != new
+            if changed.any():
+                changes[name] = (indices[changed], old[changed], new[changed])
+
+        return JournalEntry(self.label, changes, self.before, later.after)
+
+
+class Journal:
+    def __init__(self, arrays, state, initial=None, depth=JOURNAL_DEPTH, max_bytes=JOURNAL_MAX_BYTES):
+        self.arrays = arrays
+        self.depth = depth
+        self.max_bytes = max_bytes
+
+        if initial is None:
+            initial = {name: array.copy() for name, array in arrays.items()}
+        self.initial = initial
+        self.mirror = {name: np.array(array) for name, array in arrays.items()}
+        self.touched = {name: np.flatnonzero(arrays[name] != initial[name]).astype(np.int32) for name in arrays}
+        self.state = state
+
+        self.entries = []
+        self.position = 0
+
+    @profiled('journal')
+    def record(self, label, state, indices=None):
+        changes = {}
+        for name, array in self.arrays.items():
+            mirror = self.mirror[name]
+            if indices is None:
+                changed = np.flatnonzero(array != mirror).astype(np.int32)
+            else:
+                changed = indices[name][array[indices[name]] != mirror[indices[name]]]
+
+            if len(changed) > 0:
+                changes[name] = (changed, mirror[changed], array[changed].copy())
+                mirror[changed] = array[changed]
+                self.touched[name] = np.union1d(self.touched[name], changed)
+
+        del self.entries[self.position:]
+        self.entries.append(JournalEntry(label, changes, self.state, state))
+        tally(bytes=self.entries[-1].nbytes)
+        self.position = len(self.entries)
+        self.state = state
+
+        self.trim()
+
+    def trim(self):
+        while len(self.entries) > 1 and (len(self.entries) > self.depth or
+                                         sum(entry.nbytes for entry in self.entries) > self.max_bytes):
+            self.entries[:2] = [self.entries[0].coalesce(self.entries[1])]
+            self.position = max(self.position - 1, 0)
+
+    def revert(self):
+        for name, array in self.arrays.items():
+            mirror = self.mirror[name]
+            changed = np.flatnonzero(array != mirror)
+            array[changed] = mirror[changed]
+
+    def undo(self):
+        if self.position == 0:
+            return None
+
+        self.position -= 1
+        entry = self.entries[self.position]
+        entry.apply(self.arrays, undo=True)
+        entry.apply(self.mirror, undo=True)
+        self.state = entry.before
+        return entry
+
+    def redo(self):
+        if self.position == len(self.entries):
+            return None
+
+        entry = self.entries[self.position]
+        entry.apply(self.arrays)
+        entry.apply(self.mirror)
+        self.position += 1
+        self.state = entry.after
+        return entry
+
+    def restore_initial(self):
+        for name, array in self.arrays.items():
+            indices = self.touched[name]
+            array[indices] = self.initial[name][indices]
+        return self.touched
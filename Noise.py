@@ -0,0 +1,134 @@
+import numpy as np
+from opensimplex import OpenSimplex
+
+from config import SEED, MAP_SIZE, NOISE_OCTAVES, NOISE_FREQUENCY, NOISE_PERSISTENCE, NOISE_LACUNARITY, \
+    NOISE_GRID_SIZE
+
+
+STRETCH_CONSTANT = -0.211324865405187
+SQUISH_CONSTANT = 0.366025403784439
+NORM_CONSTANT = 47
+
+GRADIENTS = np.array((5, 2, 2, 5, -5, 2, -2, 5, 5, -2, 2, -5, -5, -2, -2, -5), dtype=np.float64)
+
+
+class Noise:
+    generators = {}
+
+    def __init__(self, seed=SEED, octaves=NOISE_OCTAVES, frequency=NOISE_FREQUENCY, persistence=NOISE_PERSISTENCE,
+                 lacunarity=NOISE_LACUNARITY, grid_size=NOISE_GRID_SIZE):
+        self.seed = seed
+        self.octaves = octaves
+        self.frequency = frequency
+        self.persistence = persistence
+        self.lacunarity = lacunarity
+        self.grid_size = grid_size
+
+        self.perm = np.array(OpenSimplex(seed=seed)._perm, dtype=np.int64)
+
+        self.grid = None
+
+    @classmethod
+    def get(cls, seed=SEED, octaves=NOISE_OCTAVES, frequency=NOISE_FREQUENCY, persistence=NOISE_PERSISTENCE,
+            lacunarity=NOISE_LACUNARITY, grid_size=NOISE_GRID_SIZE):
+        key = (seed, octaves, frequency, persistence, lacunarity, grid_size)
+        if key not in cls.generators:
+            cls.generators[key] = cls(*key)
+        return cls.generators[key]
+
+    def extrapolate(self, xsb, ysb, dx, dy):
+        index = self.perm[(self.perm[xsb & 0xFF] + ysb) & 0xFF] & 0x0E
+        return GRADIENTS[index] * dx + GRADIENTS[index + 1] * dy
+
+    def contribution(self, xsb, ysb, dx, dy):
+        attenuation = np.maximum(2 - dx * dx - dy * dy, 0)
+        attenuation *= attenuation
+        return attenuation * attenuation * self.extrapolate(xsb, ysb, dx, dy)
+
+    def noise2d(self, x, y):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+
+        stretch_offset = (x + y) * STRETCH_CONSTANT
+        xs = x + stretch_offset
+        ys = y + stretch_offset
+
+        xsb = np.floor(xs).astype(np.int64)
+        ysb = np.floor(ys).astype(np.int64)
+
+        squish_offset = (xsb + ysb) * SQUISH_CONSTANT
+        dx0 = x - (xsb + squish_offset)
+        dy0 = y - (ysb + squish_offset)
+
+        xins = xs - xsb
+        yins = ys - ysb
+        in_sum = xins + yins
+
+        value = self.contribution(xsb + 1, ysb, dx0 - 1 - SQUISH_CONSTANT, dy0 - SQUISH_CONSTANT)
+        value += self.contribution(xsb, ysb + 1, dx0 - SQUISH_CONSTANT, dy0 - 1 - SQUISH_CONSTANT)
+
+        lower = in_sum <= 1
+        lower_near_origin = lower & (((1 - in_sum) > xins) | ((1 - in_sum) > yins))
+        upper_near_origin = ~lower & (((2 - in_sum) < xins) | ((2 - in_sum) < yins))
+        x_larger = xins > yins
+
+        conditions = (lower_near_origin & x_larger, lower_near_origin, lower,
+                      upper_near_origin & x_larger, upper_near_origin)
+        xsv_ext = np.select(conditions, (xsb + 1, xsb - 1, xsb + 1, xsb + 2, xsb), xsb)
+        ysv_ext = np.select(conditions, (ysb - 1, ysb + 1, ysb + 1, ysb, ysb + 2), ysb)
+        dx_ext = np.select(conditions, (dx0 - 1, dx0 + 1, dx0 - 1 - 2 * SQUISH_CONSTANT,
+                                        dx0 - 2 - 2 * SQUISH_CONSTANT, dx0 - 2 * SQUISH_CONSTANT), dx0)
+        dy_ext = np.select(conditions, (dy0 + 1, dy0 - 1, dy0 - 1 - 2 * SQUISH_CONSTANT,
+                                        dy0 - 2 * SQUISH_CONSTANT, dy0 - 2 - 2 * SQUISH_CONSTANT), dy0)
+
+        xsb = np.where(lower, xsb, xsb + 1)
+        ysb = np.where(lower, ysb, ysb + 1)
+        dx0 = np.where(lower, dx0, dx0 - 1 - 2 * SQUISH_CONSTANT)
+        dy0 = np.where(lower, dy0, dy0 - 1 - 2 * SQUISH_CONSTANT)
+
+        value += self.contribution(xsb, ysb, dx0, dy0)
+        value += self.contribution(xsv_ext, ysv_ext, dx_ext, dy_ext)
+
+        return value / NORM_CONSTANT
+
+    def fractal(self, x, y):
+        x = np.asarray(x, dtype=np.float64) * (self.frequency / MAP_SIZE)
+        y = np.asarray(y, dtype=np.float64) * (self.frequency / MAP_SIZE)
+
+        value = np.zeros(np.broadcast(x, y).shape)
+        amplitude = 1
+        total_amplitude = 0
+        for octave in range(self.octaves):
+            value += self.noise2d(x, y) * amplitude
+            total_amplitude += amplitude
+            x = x * self.lacunarity
+            y = y * self.lacunarity
+            amplitude *= self.persistence
+
+        return value / total_amplitude
+
+    def build_grid(self):
+        print('Building Noise Grid.')
+        steps = np.linspace(0, MAP_SIZE, self.grid_size + 1)
+        grid_x, grid_y = np.meshgrid(steps, steps, indexing='ij')
+        self.grid = self.fractal(grid_x, grid_y)
+
+    def interpolate(self, x, y):
+        if self.grid is None:
+            self.build_grid()
+
+        x = np.clip(np.asarray(x, dtype=np.float64) / MAP_SIZE * self.grid_size, 0, self.grid_size)
+        y = np.clip(np.asarray(y, dtype=np.float64) / MAP_SIZE * self.grid_size, 0, self.grid_size)
+
+        x0 = np.minimum(x.astype(np.int64), self.grid_size - 1)
+        y0 = np.minimum(y.astype(np.int64), self.grid_size - 1)
+        tx = x - x0
+        ty = y - y0
+
+        return ((self.grid[x0, y0] * (1 - tx) + self.grid[x0 + 1, y0] * tx) * (1 - ty) +
+                (self.grid[x0, y0 + 1] * (1 - tx) + self.grid[x0 + 1, y0 + 1] * tx) * ty)
+
+    def sample(self, x, y):
+        if self.grid_size > 0:
+            return self.interpolate(x, y)
+        return self.fractal(x, y)
@@ -0,0 +1,219 @@
+import json
+import threading
+import tracemalloc
+from functools import wraps
+from time import perf_counter, process_time
+
+
+active = None
+
+
+class NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def count(self, **counts):
+        pass
+
+
+NULL_STAGE = NullStage()
+
+
+class Stage:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.path = name
+        self.depth = 0
+
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_bytes = None
+        self.counts = {}
+
+        self.start_wall = 0.0
+        self.start_cpu = 0.0
+        self.start_memory = 0
+        self.max_memory = 0
+
+    def __enter__(self):
+        self.profiler.enter(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.exit(self)
+        return False
+
+    def count(self, **counts):
+        self.counts.update(counts)
+
+    def as_dict(self):
+        record = {'stage': self.name, 'path': self.path, 'depth': self.depth,
+                  'wall': round(self.wall, 6), 'cpu': round(self.cpu, 6)}
+        if self.peak_bytes is not None:
+            record['peak_bytes'] = self.peak_bytes
+        record.update(self.counts)
+        return record
+
+
+class ProfileReport:
+    def __init__(self, stages):
+        self.stages = stages
+
+    def totals(self):
+        first_seen = {}
+        for stage in self.stages:
+            parts = stage.path.split('/')
+            for depth in range(len(parts)):
+                first_seen.setdefault('/'.join(parts[:depth + 1]), len(first_seen))
+
+        totals = {}
+        for stage in sorted(self.stages, key=lambda stage: self.tree_order(stage.path, first_seen)):
+            total = totals.setdefault(stage.path, {'calls': 0, 'wall': 0.0, 'cpu': 0.0})
+            total['calls'] += 1
+            total['wall'] += stage.wall
+            total['cpu'] += stage.cpu
+            if stage.peak_bytes is not None:
+                total['peak_bytes'] = max(total.get('peak_bytes', 0), stage.peak_bytes)
+            for name, value in stage.counts.items():
+                total[name] = total.get(name, 0) + value
+        return totals
+
+    @staticmethod
+    def tree_order(path, first_seen):
+        parts = path.split('/')
+        return [first_seen['/'.join(parts[:depth + 1])] for depth in range(len(parts))]
+
+    def as_dicts(self):
+        return [stage.as_dict() for stage in self.stages]
+
+    def __str__(self):
+        lines = ['{:40}{:>7}{:>11}{:>11}{:>11}'.format('stage', 'calls', 'wall', 'cpu', 'peak')]
+        for path, total in self.totals().items():
+            depth = path.count('/')
+            peak = '' if 'peak_bytes' not in total else '{:.1f}MB'.format(total['peak_bytes'] / 2 ** 20)
+            counts = ', '.join('{}={}'.format(name, value) for name, value in total.items()
+                               if name not in ('calls', 'wall', 'cpu', 'peak_bytes'))
+            lines.append('{:40}{:7}{:10.3f}s{:10.3f}s{:>11}  {}'.format(
+                '  ' * depth + path.rsplit('/', 1)[-1], total['calls'], total['wall'], total['cpu'], peak, counts))
+        return '\n'.join(lines)
+
+
+class Profiler:
+    def __init__(self, stream=None, trace_memory=False):
+        self.stream = stream
+        self.trace_memory = trace_memory
+
+        self.stages = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+        self.previous = None
+        self.file = None
+        self.started_tracing = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    @property
+    def stack(self):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def start(self):
+        global active
+
+        self.previous = active
+        active = self
+
+        if isinstance(self.stream, str):
+            self.file = open(self.stream, 'a')
+        else:
+            self.file = self.stream
+
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+
+    def stop(self):
+        global active
+
+        active = self.previous
+        self.previous = None
+
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+        if isinstance(self.stream, str) and self.file is not None:
+            self.file.close()
+        self.file = None
+
+    def track_memory(self):
+        if not self.trace_memory:
+            return 0
+
+        current, peak = tracemalloc.get_traced_memory()
+        for stage in self.stack:
+            stage.max_memory = max(stage.max_memory, peak)
+        tracemalloc.reset_peak()
+        return current
+
+    def enter(self, stage):
+        stage.start_memory = stage.max_memory = self.track_memory()
+        if self.stack:
+            stage.path = self.stack[-1].path + '/' + stage.name
+            stage.depth = len(self.stack)
+        self.stack.append(stage)
+
+        stage.start_cpu = process_time()
+        stage.start_wall = perf_counter()
+
+    def exit(self, stage):
+        stage.wall = perf_counter() - stage.start_wall
+        stage.cpu = process_time() - stage.start_cpu
+
+        self.track_memory()
+        if self.trace_memory:
+            stage.peak_bytes = stage.max_memory - stage.start_memory
+        self.stack.pop()
+
+        with self.lock:
+            self.stages.append(stage)
+            if self.file is not None:
+                self.file.write(json.dumps(stage.as_dict()) + '\n')
+                self.file.flush()
+
+    def report(self):
+        return ProfileReport(sorted(self.stages, key=lambda stage: stage.start_wall))
+
+
+def profile(name):
+    if active is None:
+        return NULL_STAGE
+    return Stage(active, name)
+
+
+def profiled(name):
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if active is None:
+                return function(*args, **kwargs)
+            with Stage(active, name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def tally(**counts):
+    if active is not None and active.stack:
+        active.stack[-1].count(**counts)
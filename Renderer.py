@@ -0,0 +1,306 @@
+from collections import OrderedDict
+from math import log2
+
+import numpy as np
+from pygame import Surface, draw, transform
+
+from Geography import GeographyType, region_colors, DRAW_REGION_LABELS, DRAW_CORNER_LABELS
+from gui import labels
+from Profiling import profiled, tally
+from config import MAP_SIZE, POINT_RADIUS, DRAW_CORNERS, DRAW_REGION_OUTLINE, REGION_OUTLINE_WIDTH, \
+    REGION_LABEL_SIZE, CORNER_LABEL_SIZE, LABEL_MIN_SIZE, TILE_SIZE, TILE_CACHE_SIZE, TILE_PAINT_BUDGET, \
+    VIEWPORT_SIZE, VIEWPORT_MAX_ZOOM, CHUNK_RESOLUTION, DRAW_RIVERS, RIVER_COLOR, RIVER_WIDTH, RIVER_MAX_WIDTH, \
+    RIVER_MIN_DRAINAGE, DRAW_MOUNTAINS, MOUNTAIN_WIDTH
+
+
+PAINT_MARGIN = max(REGION_OUTLINE_WIDTH, POINT_RADIUS, 2 * REGION_LABEL_SIZE)
+
+
+class Tile:
+    def __init__(self, surface):
+        self.surface = surface
+        self.stale = False
+
+
+class TileRenderer:
+    def __init__(self, geography, tile_size=TILE_SIZE, cache_size=TILE_CACHE_SIZE, paint_budget=TILE_PAINT_BUDGET):
+        self.geography = geography
+        self.tile_size = tile_size
+        self.cache_size = cache_size
+        self.paint_budget = paint_budget
+        self.max_level = int(log2(VIEWPORT_MAX_ZOOM))
+
+        self.tiles = OrderedDict()
+        self.queue = OrderedDict()
+
+        self.hull_offsets = np.zeros(1, dtype=np.int64)
+        self.hull_points = np.zeros((0, 2))
+        self.bounds = np.zeros((0, 4))
+        self.update_geometry()
+
+    def update_geometry(self):
+        self.hull_offsets = np.asarray(self.geography.hull_offsets)
+        self.hull_points = np.asarray(self.geography.hull_points, dtype=np.float64)
+
+        starts = self.hull_offsets[:-1]
+        drawn = np.diff(self.hull_offsets) > 0
+        self.bounds = np.full((len(starts), 4), np.inf)
+        self.bounds[:, 2:] = -np.inf
+        if drawn.any():
+            for axis in (0, 1):
+                self.bounds[drawn, axis] = np.minimum.reduceat(self.hull_points[:, axis], starts[drawn])
+                self.bounds[drawn, axis + 2] = np.maximum.reduceat(self.hull_points[:, axis], starts[drawn])
+
+        self.tiles.clear()
+        self.queue.clear()
+        self.build_base()
+
+    def regions_in(self, left, top, right, bottom):
+        return np.nonzero((self.bounds[:, 0] <= right) & (self.bounds[:, 2] >= left) &
+                          (self.bounds[:, 1] <= bottom) & (self.bounds[:, 3] >= top))[0]
+
+    def corners_in(self, left, top, right, bottom):
+        location = self.geography.corner_data.location
+        return np.nonzero((location[:, 0] >= left) & (location[:, 0] <= right) &
+                          (location[:, 1] >= top) & (location[:, 1] <= bottom))[0]
+
+    @profiled('paint')
+    def paint(self, surface, origin, scale):
+        width, height = surface.get_size()
+        area = (origin[0] / scale - PAINT_MARGIN, origin[1] / scale - PAINT_MARGIN,
+                (origin[0] + width) / scale + PAINT_MARGIN, (origin[1] + height) / scale + PAINT_MARGIN)
+        offset = np.array(origin, dtype=np.float64)
+
+        surface.fill((0, 0, 0))
+
+        regions = self.regions_in(*area)
+        tally(regions=len(regions))
+        colors = region_colors(self.geography.region_data, regions)
+        outline_width = max(1, int(REGION_OUTLINE_WIDTH * scale))
+
+        counts = self.hull_offsets[regions + 1] - self.hull_offsets[regions]
+        ends = np.cumsum(counts)
+        positions = np.repeat(self.hull_offsets[regions] - ends + counts, counts) + np.arange(counts.sum())
+        vertices = (np.rint(self.hull_points[positions] * scale) - offset).tolist()
+        for i, region in enumerate(regions):
+            if counts[i] < 3:
+                continue
+            points = vertices[ends[i] - counts[i]:ends[i]]
+            if colors is not None:
+                draw.polygon(surface, colors[i], points, 0)
+            if DRAW_REGION_OUTLINE:
+                draw.polygon(surface, (0, 0, 0), points, outline_width)
+
+        if DRAW_MOUNTAINS:
+            self.paint_mountains(surface, area, offset, scale)
+        if DRAW_RIVERS:
+            self.paint_rivers(surface, area, offset, scale)
+
+        if DRAW_CORNERS or DRAW_CORNER_LABELS:
+            corners = self.corners_in(*area)
+            positions = (np.rint(self.geography.corner_data.location[corners] * scale) - offset).astype(int).tolist()
+            for corner, position in zip(corners, positions):
+                corner = self.geography.corners[corner]
+                if DRAW_CORNERS:
+                    draw.circle(surface, corner.type.value, position, max(1, int(POINT_RADIUS * scale)))
+                self.paint_label(surface, corner.label(), CORNER_LABEL_SIZE * scale, (0, 255, 0), position)
+
+        if DRAW_REGION_LABELS:
+            positions = (np.rint(self.geography.region_data.location[regions] * scale) - offset).astype(int).tolist()
+            for region, position in zip(regions, positions):
+                self.paint_label(surface, self.geography.regions[region].label(), REGION_LABEL_SIZE * scale,
+                                 (255, 0, 0), position)
+
+    def edges_in(self, edges, left, top, right, bottom):
+        sources, targets = edges
+        location = self.geography.corner_data.location
+        start, end = location[sources], location[targets]
+        inside = (np.minimum(start[:, 0], end[:, 0]) <= right) & (np.maximum(start[:, 0], end[:, 0]) >= left) & \
+            (np.minimum(start[:, 1], end[:, 1]) <= bottom) & (np.maximum(start[:, 1], end[:, 1]) >= top)
+        return sources[inside], targets[inside]
+
+    def paint_mountains(self, surface, area, offset, scale):
+        sources, targets = self.edges_in(self.geography.mountain_edges(), *area)
+        tally(ridges=len(sources))
+
+        location = self.geography.corner_data.location
+        width = max(1, int(MOUNTAIN_WIDTH * scale))
+        starts = (np.rint(location[sources] * scale) - offset).tolist()
+        ends = (np.rint(location[targets] * scale) - offset).tolist()
+        for start, end in zip(starts, ends):
+            draw.line(surface, GeographyType.MOUNTAIN.value, start, end, width)
+
+    def paint_rivers(self, surface, area, offset, scale):
+        sources, targets = self.edges_in(self.geography.river_edges(), *area)
+        tally(rivers=len(sources))
+
+        location = self.geography.corner_data.location
+        flux = self.geography.corner_data.flux[sources]
+        widths = np.minimum(RIVER_WIDTH * np.sqrt(flux / RIVER_MIN_DRAINAGE), RIVER_MAX_WIDTH) * scale
+        starts = (np.rint(location[sources] * scale) - offset).tolist()
+        ends = (np.rint(location[targets] * scale) - offset).tolist()
+        for start, end, width in zip(starts, ends, np.maximum(widths, 1).astype(int).tolist()):
+            draw.line(surface, RIVER_COLOR, start, end, width)
+
+    def paint_label(self, surface, text, size, color, position):
+        if text is not None and size >= LABEL_MIN_SIZE:
+            labels.draw(surface, text, int(size), color, position)
+
+    def render_map(self, size):
+        surface = Surface((size, size))
+        self.paint(surface, (0, 0), size / MAP_SIZE)
+        return surface
+
+    def level_size(self, level):
+        return VIEWPORT_SIZE * 2 ** level
+
+    def level_for(self, map_size):
+        level = min(max(int(round(log2(max(map_size / VIEWPORT_SIZE, 1)))), 0), self.max_level)
+        return level, self.level_size(level)
+
+    def tile_count(self, level):
+        return -(-self.level_size(level) // self.tile_size)
+
+    @profiled('build_base')
+    def build_base(self):
+        for tx in range(self.tile_count(0)):
+            for ty in range(self.tile_count(0)):
+                self.paint_tile(0, tx, ty)
+
+    def paint_tile(self, level, tx, ty):
+        key = (level, tx, ty)
+        tile = self.tiles.get(key)
+        was_stale = tile is not None and tile.stale
+        if tile is None:
+            tile = Tile(Surface((self.tile_size, self.tile_size), 0, 32))
+
+        self.paint(tile.surface, (tx * self.tile_size, ty * self.tile_size), self.level_size(level) / MAP_SIZE)
+        tile.stale = False
+        self.store(key, tile)
+
+        if was_stale:
+            self.propagate(level, tx, ty)
+
+    def propagate(self, level, tx, ty):
+        surface = self.tiles[(level, tx, ty)].surface
+        for ancestor in range(level - 1, -1, -1):
+            scale = 2 ** (level - ancestor)
+            parent = self.tiles.get((ancestor, tx // scale, ty // scale))
+            if parent is not None:
+                size = self.tile_size // scale
+                parent.surface.blit(transform.smoothscale(surface, (size, size)),
+                                    ((tx % scale) * size, (ty % scale) * size))
+
+    def store(self, key, tile):
+        self.tiles[key] = tile
+        self.tiles.move_to_end(key)
+        if len(self.tiles) > self.cache_size:
+            for old_key in list(self.tiles):
+                if len(self.tiles) <= self.cache_size:
+                    break
+                if old_key[0] > 0:
+                    del self.tiles[old_key]
+
+    def downsample(self, level, tx, ty):
+        if level >= self.max_level:
+            return None
+
+        children = [self.tiles.get((level + 1, tx * 2 + dx, ty * 2 + dy)) for dx in (0, 1) for dy in (0, 1)]
+        if any(child is None or child.stale for child in children):
+            return None
+
+        combined = Surface((self.tile_size * 2, self.tile_size * 2), 0, 32)
+        for child, position in zip(children, ((0, 0), (0, 1), (1, 0), (1, 1))):
+            combined.blit(child.surface, (position[0] * self.tile_size, position[1] * self.tile_size))
+
+        tile = Tile(transform.smoothscale(combined, (self.tile_size, self.tile_size)))
+        self.store((level, tx, ty), tile)
+        return tile
+
+    def upsample(self, level, tx, ty):
+        for ancestor in range(level - 1, -1, -1):
+            scale = 2 ** (level - ancestor)
+            parent = self.tiles.get((ancestor, tx // scale, ty // scale))
+            if parent is not None:
+                size = self.tile_size // scale
+                window = parent.surface.subsurface(((tx % scale) * size, (ty % scale) * size, size, size))
+                return transform.scale(window, (self.tile_size, self.tile_size))
+
+        return Surface((self.tile_size, self.tile_size), 0, 32)
+
+    def request(self, level, tx, ty):
+        key = (level, tx, ty)
+        tile = self.tiles.get(key)
+        if tile is None:
+            tile = self.downsample(level, tx, ty)
+
+        if tile is None:
+            self.queue[key] = True
+            return self.upsample(level, tx, ty)
+
+        self.tiles.move_to_end(key)
+        if tile.stale:
+            self.queue[key] = True
+        return tile.surface
+
+    def update(self):
+        for _ in range(min(self.paint_budget, len(self.queue))):
+            self.paint_tile(*self.queue.popitem()[0])
+        self.queue.clear()
+
+    def invalidate(self, area=None):
+        for key, tile in self.tiles.items():
+            if area is None:
+                tile.stale = True
+                continue
+
+            left, top, right, bottom = area
+            level, tx, ty = key
+            tile_size = self.tile_size * MAP_SIZE / self.level_size(level)
+            if tx * tile_size - PAINT_MARGIN <= right and (tx + 1) * tile_size + PAINT_MARGIN >= left and \
+                    ty * tile_size - PAINT_MARGIN <= bottom and (ty + 1) * tile_size + PAINT_MARGIN >= top:
+                tile.stale = True
+
+
+class ChunkRenderer:
+    def __init__(self, world, resolution=CHUNK_RESOLUTION):
+        self.world = world
+        self.resolution = resolution
+        self.surfaces = {}
+
+    def paint_chunk(self, chunk):
+        surface = Surface((self.resolution, self.resolution), 0, 32)
+        surface.fill((0, 0, 0))
+
+        scale = self.resolution / self.world.chunk_size
+        offset = self.world.origin(*chunk.key) * scale
+        colors = region_colors(chunk.region_data)
+        outline_width = max(1, int(REGION_OUTLINE_WIDTH * scale))
+        for region in range(len(chunk)):
+            points = (np.rint(chunk.hull(region) * scale - offset)).tolist()
+            if colors is not None:
+                draw.polygon(surface, colors[region], points, 0)
+            if DRAW_REGION_OUTLINE:
+                draw.polygon(surface, (0, 0, 0), points, outline_width)
+
+        return surface
+
+    def paint(self, surface, origin, scale):
+        width, height = surface.get_size()
+        area = (origin[0] / scale, origin[1] / scale, (origin[0] + width) / scale, (origin[1] + height) / scale)
+
+        surface.fill((0, 0, 0))
+
+        chunks = self.world.load(area)
+        for chunk in chunks:
+            if chunk.key not in self.surfaces:
+                self.surfaces[chunk.key] = self.paint_chunk(chunk)
+
+            left, top = np.rint(self.world.origin(*chunk.key) * scale).astype(int)
+            right, bottom = np.rint(self.world.origin(chunk.key[0] + 1, chunk.key[1] + 1) * scale).astype(int)
+            surface.blit(transform.scale(self.surfaces[chunk.key], (right - left, bottom - top)),
+                         (left - int(origin[0]), top - int(origin[1])))
+
+        for key in list(self.surfaces):
+            if key not in self.world.chunks:
+                del self.surfaces[key]
@@ -0,0 +1,29 @@
+import json
+import os
+
+import numpy as np
+
+
+def write_array(path, array):
+    with open(path + '.tmp', 'wb') as file:
+        np.save(file, np.ascontiguousarray(array))
+    os.replace(path + '.tmp', path)
+
+
+def read_array(path):
+    return np.asarray(np.load(path, mmap_mode='c'))
+
+
+def write_json(path, data):
+    with open(path + '.tmp', 'w') as file:
+        json.dump(data, file, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def read_json(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def directory_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
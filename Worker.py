@@ -0,0 +1,136 @@
+import queue
+import threading
+from time import perf_counter
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, label, function, *args):
+        self.label = label
+        self.function = function
+        self.args = args
+
+        self.stage = label
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.elapsed = 0.0
+
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+
+    def report(self, stage, fraction):
+        if self.cancelled.is_set():
+            raise JobCancelled(self.label)
+        self.stage = stage
+        self.progress = fraction
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def execute(self):
+        return self.function(*self.args)
+
+    def run(self):
+        start = perf_counter()
+        try:
+            if self.cancelled.is_set():
+                raise JobCancelled(self.label)
+            self.result = self.execute()
+            self.progress = 1.0
+        except JobCancelled:
+            print('Cancelled %s.\n' % self.label)
+        except Exception as error:
+            self.error = error
+            print('%s failed: %s\n' % (self.label, error))
+        finally:
+            self.elapsed = perf_counter() - start
+            self.done.set()
+
+
+class GeographyJob(Job):
+    def __init__(self, label, geography, method, *args):
+        super().__init__(label, getattr(geography, method), *args)
+        self.geography = geography
+        self.area = None
+
+    def execute(self):
+        self.geography.observer = self.report
+        try:
+            return super().execute()
+        except BaseException:
+            self.geography.rollback()
+            raise
+        finally:
+            self.geography.observer = None
+            _, self.area = self.geography.take_changes()
+
+
+class Worker:
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.current = None
+
+        self.lock = threading.Lock()
+        self.pending = 0
+
+        self.thread = threading.Thread(target=self.run, name='Worker', daemon=True)
+        self.thread.start()
+
+    @property
+    def busy(self):
+        with self.lock:
+            return self.pending > 0
+
+    def submit(self, job):
+        with self.lock:
+            self.pending += 1
+        self.jobs.put(job)
+        return job
+
+    def cancel(self):
+        with self.lock:
+            jobs = list(self.jobs.queue)
+            current = self.current
+        for job in jobs + [current]:
+            if job is not None:
+                job.cancel()
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+
+            with self.lock:
+                self.current = job
+            job.run()
+            with self.lock:
+                self.current = None
+                self.pending -= 1
+            self.results.put(job)
+
+    def finished(self):
+        jobs = []
+        while True:
+            try:
+                jobs.append(self.results.get_nowait())
+            except queue.Empty:
+                return jobs
+
+    def status(self):
+        with self.lock:
+            job = self.current
+            waiting = self.pending - (job is not None)
+        if job is None:
+            return None
+        return job.label, job.stage, job.progress, waiting
+
+    def stop(self, timeout=None):
+        self.cancel()
+        self.jobs.put(None)
+        self.thread.join(timeout)
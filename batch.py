@@ -0,0 +1,126 @@
+import argparse
+import contextlib
+import json
+import os
+import time
+
+import numpy as np
+
+from Geography import Geography, GeographyType, TYPES
+from Profiling import Profiler
+from config import SEED, GRAPH_MAX_POINTS, GRAPH_RELAXATIONS
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Generate worlds without opening a pygame window.')
+    parser.add_argument('--seeds', type=int, nargs='+', default=[SEED],
+                        help='Seeds to generate, one world per seed.')
+    parser.add_argument('--points', type=int, default=GRAPH_MAX_POINTS,
+                        help='Number of Voronoi points per world.')
+    parser.add_argument('--relaxations', type=int, default=GRAPH_RELAXATIONS,
+                        help='Number of Lloyd relaxations per world.')
+    parser.add_argument('--land', type=float, nargs=3, action='append', metavar=('X', 'Y', 'RADIUS'),
+                        help='Create a landmass at X, Y with the given radius. Can be repeated. '
+                             'Defaults to the starting land from config.py.')
+    parser.add_argument('--no-finalize', action='store_true',
+                        help='Skip finalization (oceans, distances, landmasses, elevation and rivers).')
+    parser.add_argument('--output', default='worlds',
+                        help='Directory the worlds and summary.jsonl are written to.')
+    parser.add_argument('--render', action='store_true',
+                        help='Also save a PNG of every world. This is the only option that imports pygame.')
+    parser.add_argument('--render-size', type=int, default=1000,
+                        help='Width and height of the rendered PNGs.')
+    parser.add_argument('--profile', metavar='PATH',
+                        help='Print a per-stage timing report for every world and append each stage to PATH '
+                             'as JSON lines.')
+    parser.add_argument('--quiet', action='store_true',
+                        help='Hide the progress output of the generator.')
+    return parser.parse_args(argv)
+
+
+def generate(seed, args):
+    geo = Geography(seed=seed, max_points=args.points, relaxations=args.relaxations,
+                    starting_land=args.land is None)
+    for x, y, radius in args.land or []:
+        geo.create_land((x, y), radius)
+    if not args.no_finalize:
+        geo.finalize()
+    return geo
+
+
+def world_arrays(geo):
+    sizes = np.array([l.size for l in geo.land_masses], dtype=np.int64)
+    land_mass_ids = np.empty(len(sizes) + 1, dtype=np.int32)
+    land_mass_ids[np.argsort(-sizes, kind='stable')] = np.arange(len(sizes))
+    land_mass_ids[-1] = -1
+
+    arrays = {}
+    for prefix, data in (('region', geo.region_data), ('corner', geo.corner_data)):
+        arrays[prefix + '_location'] = data.location
+        arrays[prefix + '_type'] = data.type
+        arrays[prefix + '_elevation'] = data.elevation
+        arrays[prefix + '_steps_from_ocean'] = data.steps_from_ocean
+        arrays[prefix + '_steps_from_water'] = data.steps_from_water
+        arrays[prefix + '_landmass'] = land_mass_ids[data.landmass]
+    arrays['corner_downslope'] = geo.corner_data.downslope
+    arrays['corner_flux'] = geo.corner_data.flux
+    arrays['region_hull_offsets'] = geo.hull_offsets
+    arrays['region_hull_points'] = geo.hull_points
+    arrays['type_names'] = np.array([t.name for t in TYPES])
+
+    return arrays
+
+
+def summarize(geo, seed, elapsed):
+    regions = geo.region_data
+    return {
+        'seed': seed,
+        'seconds': round(elapsed, 3),
+        'regions': len(geo.regions),
+        'corners': len(geo.corners),
+        'land_regions': int(np.count_nonzero(regions.has_type(GeographyType.LAND, GeographyType.COAST))),
+        'water_regions': int(np.count_nonzero(regions.has_type(GeographyType.WATER))),
+        'ocean_regions': int(np.count_nonzero(regions.has_type(GeographyType.OCEAN))),
+        'land_masses': sorted((l.size for l in geo.land_masses), reverse=True),
+        'river_corners': len(geo.river_edges()[0]),
+    }
+
+
+def render(geo, path, size):
+    import pygame
+    from Renderer import TileRenderer
+
+    pygame.image.save(TileRenderer(geo).render_map(size), path)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(args.output, exist_ok=True)
+
+    with open(os.path.join(args.output, 'summary.jsonl'), 'a') as summary_file:
+        for seed in args.seeds:
+            print('Generating world for seed ', seed, '.', sep='')
+            start = time.time()
+            profiler = Profiler(args.profile, trace_memory=True) if args.profile else None
+            with contextlib.ExitStack() as stack:
+                if profiler is not None:
+                    stack.enter_context(profiler)
+                if args.quiet:
+                    stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w'))))
+                geo = generate(seed, args)
+            elapsed = time.time() - start
+
+            if profiler is not None:
+                print(profiler.report())
+
+            np.savez(os.path.join(args.output, 'world_{}.npz'.format(seed)), **world_arrays(geo))
+            if args.render:
+                render(geo, os.path.join(args.output, 'world_{}.png'.format(seed)), args.render_size)
+
+            summary_file.write(json.dumps(summarize(geo, seed, elapsed)) + '\n')
+            summary_file.flush()
+            print('Finished in ', round(elapsed, 2), 's.', sep='')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from Geography import Geography, convert_graph
+from Graph import Graph, order_polygons
+from GraphCache import GraphCache
+from config import SEED, GRAPH_RELAXATIONS, GRAPH_RELAXATION_TOLERANCE, STARTING_LAND_POS, STARTING_LAND_SIZE
+
+
+BENCHMARK_SIZES = (1000, 7500, 50000, 200000)
+BENCHMARK_VERSION = 1
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Time every stage of world generation at several graph sizes.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(BENCHMARK_SIZES),
+                        help='Numbers of Voronoi points to benchmark.')
+    parser.add_argument('--seed', type=int, default=SEED,
+                        help='Seed used for every size.')
+    parser.add_argument('--relaxations', type=int, default=GRAPH_RELAXATIONS,
+                        help='Number of Lloyd relaxations.')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='Run every size this many times and keep the fastest time of each stage.')
+    parser.add_argument('--output', default='benchmark.json',
+                        help='File the results are written to.')
+    parser.add_argument('--baseline', default='benchmark_baseline.json',
+                        help='Results to compare against. Skipped if the file does not exist.')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Also write the results to the baseline file.')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed slowdown or memory growth of a stage, as a fraction of the baseline.')
+    parser.add_argument('--min-seconds', type=float, default=0.05,
+                        help='Time differences below this many seconds are never reported as regressions.')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='Do not trace peak memory. Tracing slows down stages that allocate many objects.')
+    parser.add_argument('--no-draw', action='store_true',
+                        help='Skip the draw stage. This is the only stage that imports pygame.')
+    parser.add_argument('--verbose', action='store_true',
+                        help='Show the progress output of the generator.')
+    return parser.parse_args(argv)
+
+
+class StageTimer:
+    def __init__(self, trace_memory):
+        self.trace_memory = trace_memory
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        yield
+        seconds = time.perf_counter() - start
+
+        result = {'seconds': seconds}
+        if self.trace_memory:
+            result['peak_bytes'] = tracemalloc.get_traced_memory()[1] - baseline
+        self.stages[name] = result
+
+
+def run_size(points, args, cache_directory):
+    timer = StageTimer(not args.no_memory)
+
+    with timer.stage('graph'):
+        graph = Graph(points, args.relaxations, GRAPH_RELAXATION_TOLERANCE, seed=args.seed)
+    with timer.stage('polygons'):
+        order_polygons(graph.center_points, graph.center_corners, graph.corner_points)
+
+    cache = GraphCache(cache_directory, max_bytes=float('inf'))
+    cache.store(GraphCache.key(args.seed, points, args.relaxations, GRAPH_RELAXATION_TOLERANCE), convert_graph(graph))
+    del graph
+
+    with timer.stage('conversion'):
+        geo = Geography(args.seed, points, args.relaxations, starting_land=False, graph_cache=cache)
+    with timer.stage('create_land'):
+        geo.create_land(STARTING_LAND_POS, STARTING_LAND_SIZE)
+    with timer.stage('create_oceans'):
+        geo.create_oceans()
+    with timer.stage('find_distances'):
+        geo.find_distances()
+    with timer.stage('create_land_masses'):
+        geo.create_land_masses()
+    with timer.stage('create_mountain_ranges'):
+        geo.create_mountain_ranges()
+    with timer.stage('set_elevation'):
+        geo.set_elevation()
+    with timer.stage('create_rivers'):
+        geo.create_rivers()
+
+    if not args.no_draw:
+        from Renderer import TileRenderer
+
+        with timer.stage('draw'):
+            TileRenderer(geo)
+
+    geo.edited[:] = False
+    geo.create_land((STARTING_LAND_POS[0] + STARTING_LAND_SIZE * 0.75, STARTING_LAND_POS[1]), STARTING_LAND_SIZE / 5)
+    with timer.stage('refinalize'):
+        geo.refinalize()
+
+    downslope = geo.corner_data.downslope.copy()
+    flux = geo.corner_data.flux.copy()
+    geo.create_rivers()
+    rivers_consistent = np.array_equal(downslope, geo.corner_data.downslope) and np.allclose(flux, geo.corner_data.flux)
+
+    return {
+        'points': points,
+        'regions': len(geo.region_data),
+        'corners': len(geo.corner_data),
+        'land_masses': len(geo.land_masses),
+        'rivers_consistent': bool(rivers_consistent),
+        'stages': timer.stages,
+    }
+
+
+def merge_runs(runs):
+    result = runs[0]
+    for name, stage in result['stages'].items():
+        for key in stage:
+            stage[key] = min(run['stages'][name][key] for run in runs)
+    result['total_seconds'] = sum(stage['seconds'] for stage in result['stages'].values())
+    result['rivers_consistent'] = all(run['rivers_consistent'] for run in runs)
+    return result
+
+
+def compare(results, baseline, tolerance, min_seconds):
+    regressions = []
+    previous = {result['points']: result for result in baseline['results']}
+    for result in results['results']:
+        old = previous.get(result['points'])
+        if old is None:
+            continue
+
+        for name, stage in result['stages'].items():
+            old_stage = old['stages'].get(name)
+            if old_stage is None:
+                continue
+
+            seconds, old_seconds = stage['seconds'], old_stage['seconds']
+            if seconds > old_seconds * (1 + tolerance) and seconds - old_seconds > min_seconds:
+                regressions.append('{} points, {}: {:.3f}s -> {:.3f}s'.format(result['points'], name,
+                                                                            old_seconds, seconds))
+
+            peak, old_peak = stage.get('peak_bytes'), old_stage.get('peak_bytes')
+            if peak is not None and old_peak is not None and peak > old_peak * (1 + tolerance) and \
+                    peak - old_peak > 2 ** 20:
+                regressions.append('{} points, {}: {:.1f}MB -> {:.1f}MB peak'.format(
+                    result['points'], name, old_peak / 2 ** 20, peak / 2 ** 20))
+
+    return regressions
+
+
+def print_results(results):
+    for result in results['results']:
+        print('{} points ({} regions, {} corners, {} land masses): {:.3f}s'.format(
+            result['points'], result['regions'], result['corners'], result['land_masses'], result['total_seconds']))
+        for name, stage in result['stages'].items():
+            memory = '' if 'peak_bytes' not in stage else '  {:10.1f}MB'.format(stage['peak_bytes'] / 2 ** 20)
+            print('    {:24}{:9.3f}s{}'.format(name, stage['seconds'], memory))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = {
+        'version': BENCHMARK_VERSION,
+        'seed': args.seed,
+        'relaxations': args.relaxations,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'results': [],
+    }
+
+    if not args.no_memory:
+        tracemalloc.start()
+
+    cache_directory = tempfile.mkdtemp(prefix='benchmark_graphs_')
+    try:
+        for points in args.sizes:
+            print('Benchmarking ', points, ' points.', sep='')
+            runs = []
+            for _ in range(args.repeat):
+                with contextlib.ExitStack() as stack:
+                    if not args.verbose:
+                        stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w'))))
+                    runs.append(run_size(points, args, cache_directory))
+            results['results'].append(merge_runs(runs))
+    finally:
+        shutil.rmtree(cache_directory, ignore_errors=True)
+
+    print_results(results)
+
+    with open(args.output, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+
+    inconsistent = [result['points'] for result in results['results'] if not result['rivers_consistent']]
+    if inconsistent:
+        print('Rivers after refinalize differ from a full retrace at', ', '.join(map(str, inconsistent)), 'points.')
+        return 1
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        print('Saved baseline to ', args.baseline, '.', sep='')
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print('No baseline at ', args.baseline, ', nothing to compare against.', sep='')
+        return 0
+
+    with open(args.baseline) as baseline_file:
+        regressions = compare(results, json.load(baseline_file), args.tolerance, args.min_seconds)
+    if regressions:
+        print('Regressions against ', args.baseline, ':', sep='')
+        for regression in regressions:
+            print('    ' + regression)
+        return 1
+
+    print('No regressions against ', args.baseline, '.', sep='')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,8 +5,19 @@ MAP_SIZE = 10000
 # GRAPH
 GRAPH_MAX_POINTS = 7500
 GRAPH_RELAXATIONS = 2
+GRAPH_RELAXATION_TOLERANCE = 0
+GRAPH_CACHE_DIR = 'graph_cache'
+GRAPH_CACHE_MAX_BYTES = 512 * 2 ** 20
+GRAPH_CACHE_STAGING_MAX_AGE = 3600
 POINT_RADIUS = 15
 
+# NOISE
+NOISE_OCTAVES = 1
+NOISE_FREQUENCY = MAP_SIZE
+NOISE_PERSISTENCE = 0.5
+NOISE_LACUNARITY = 2
+NOISE_GRID_SIZE = 0
+
 # GEO
 STARTING_LAND = True
 STARTING_LAND_SIZE = 5000
@@ -23,6 +34,34 @@ ELEVATION_PERLIN_WEIGHT = 1.25
 RANDOM_LAKE_FACTOR = 0.03
 LAND_MASS_CULL_SIZE = 15
 
+RIVER_MIN_DRAINAGE = 0.002
+
+MOUNTAIN_REGIONS_PER_RANGE = 400
+MOUNTAIN_MAX_RANGES = 8
+MOUNTAIN_MIN_STEPS_FROM_OCEAN = 3
+MOUNTAIN_SPACING = 1500
+MOUNTAIN_RANGE_LENGTH = 3000
+MOUNTAIN_NOISE_COST = 2
+MOUNTAIN_COAST_COST = 4
+MOUNTAIN_ELEVATION = 0.3
+
+JOURNAL_DEPTH = 64
+JOURNAL_MAX_BYTES = 64 * 2 ** 20
+
+# CHUNKS
+CHUNK_SIZE = 2500
+CHUNK_POINTS = 400
+CHUNK_HALO = 500
+CHUNK_CACHE_SIZE = 64
+CHUNK_POINT_CACHE_SIZE = 256
+CHUNK_BUILD_BUDGET = 2
+CHUNK_RESOLUTION = 256
+
+CHUNK_LAND_OCTAVES = 4
+CHUNK_LAND_FREQUENCY = 2
+CHUNK_LAND_THRESHOLD = 0.0
+CHUNK_LAND_RELIEF = 0.3
+
 DRAW_CORNERS = False
 DRAW_REGION_OUTLINE = True
 REGION_OUTLINE_WIDTH = 10
@@ -33,12 +72,26 @@ DRAW_DISTANCE_FROM_WATER_REGIONS = False
 DRAW_DISTANCE_FROM_OCEAN_CORNERS = False
 DRAW_DISTANCE_FROM_WATER_CORNERS = False
 
+LABEL_FONT = 'ariel'
+LABEL_CACHE_SIZE = 1024
+LABEL_MIN_SIZE = 8
+REGION_LABEL_SIZE = 60
+CORNER_LABEL_SIZE = 40
+
 DRAW_REGIONS_NORMAL = False
 DRAW_REGIONS_ELEVATION = False
 DRAW_REGIONS_ELEVATION_COLORED = True
 DRAW_REGIONS_OCEAN_DISTANCE = False
 DRAW_REGIONS_WATER_DISTANCE = False
 
+DRAW_RIVERS = True
+RIVER_COLOR = (50, 50, 255)
+RIVER_WIDTH = 10
+RIVER_MAX_WIDTH = 50
+
+DRAW_MOUNTAINS = True
+MOUNTAIN_WIDTH = 30
+
 # GUI
 SCREEN_WIDTH = 1000
 SCREEN_HEIGHT = 800
@@ -53,3 +106,7 @@ BUTTON_RESET_TIME = 0.1
 VIEWPORT_MOVING_SPEED = 200
 VIEWPORT_MAX_ZOOM = 8
 VIEWPORT_SIZE = 800
+
+TILE_SIZE = 256
+TILE_CACHE_SIZE = 256
+TILE_PAINT_BUDGET = 4
@@ -0,0 +1,53 @@
+from pygame import display, event, time, font
+import pygame
+
+from gui import ChunkViewport
+from Chunks import ChunkWorld
+from Renderer import ChunkRenderer
+from config import SCREEN_HEIGHT, SCREEN_WIDTH
+
+display.init()
+font.init()
+screen = display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+clock = time.Clock()
+
+world = ChunkWorld()
+viewport = ChunkViewport(ChunkRenderer(world), (200, 0))
+
+keys = set()
+game_over = False
+while not game_over:
+    elapsed = clock.tick() / 1000
+    for curr_event in event.get():
+        if curr_event.type == pygame.QUIT:
+            game_over = True
+        elif curr_event.type == pygame.KEYDOWN:
+            if curr_event.key == pygame.K_ESCAPE:
+                game_over = True
+            if curr_event.key == pygame.K_z:
+                viewport.zoom(0.5)
+            if curr_event.key == pygame.K_x:
+                viewport.zoom(2)
+            keys.add(curr_event.key)
+        elif curr_event.type == pygame.KEYUP:
+            keys.discard(curr_event.key)
+
+    dx = dy = 0
+    if pygame.K_LEFT in keys:
+        dx = -1
+    if pygame.K_RIGHT in keys:
+        dx = 1
+    if pygame.K_DOWN in keys:
+        dy = 1
+    if pygame.K_UP in keys:
+        dy = -1
+
+    viewport.update(elapsed, dx, dy)
+
+    screen.fill((0, 0, 0))
+    viewport.draw(screen)
+
+    display.flip()
+
+display.quit()
+font.quit()
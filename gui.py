@@ -1,9 +1,10 @@
+from collections import OrderedDict
 from enum import Enum
 
-from pygame import Surface, transform, font
+from pygame import Surface, font, transform
 
 from config import BUTTON_BUFFER, BUTTON_WIDTH, BUTTON_HEIGHT, BUTTON_FONT, BUTTON_FONT_SIZE, BUTTON_RESET_TIME, \
-    VIEWPORT_MOVING_SPEED, VIEWPORT_MAX_ZOOM, VIEWPORT_SIZE
+    VIEWPORT_MOVING_SPEED, VIEWPORT_MAX_ZOOM, VIEWPORT_SIZE, LABEL_FONT, LABEL_CACHE_SIZE, MAP_SIZE
 
 
 class ButtonState(Enum):
@@ -54,15 +55,14 @@ class Button:
 
 
 class Viewport:
-    def __init__(self, subject, location):
+    def __init__(self, renderer, location):
         self.location = location
 
-        self.subject = subject
-        self.draw_subject = self.subject
-        self.center = ((self.draw_subject.get_width() - VIEWPORT_SIZE) / 2,
-                       (self.draw_subject.get_height() - VIEWPORT_SIZE) / 2)
+        self.renderer = renderer
+        self.subject_size = VIEWPORT_SIZE
+        self.center = ((self.subject_size - VIEWPORT_SIZE) / 2, (self.subject_size - VIEWPORT_SIZE) / 2)
         self.subject_location = [self.center[0], self.center[1]]
-        self.initial_subject_size = (self.draw_subject.get_width(), self.draw_subject.get_height())
+        self.initial_subject_size = (MAP_SIZE, MAP_SIZE)
 
         self.moving_towards_center = False
         self.zoom_factor = 1
@@ -73,10 +73,10 @@ class Viewport:
 
     def move(self, elapsed, dx, dy):
         if dx < 0 < self.subject_location[0] or \
-                (dx > 0 and self.draw_subject.get_width() - self.subject_location[0] > VIEWPORT_SIZE):
+                (dx > 0 and self.subject_size - self.subject_location[0] > VIEWPORT_SIZE):
             self.subject_location[0] += dx * VIEWPORT_MOVING_SPEED * elapsed
         if dy < 0 < self.subject_location[1] or \
-                (dy > 0 and self.draw_subject.get_height() - self.subject_location[1] > VIEWPORT_SIZE):
+                (dy > 0 and self.subject_size - self.subject_location[1] > VIEWPORT_SIZE):
             self.subject_location[1] += dy * VIEWPORT_MOVING_SPEED * elapsed
 
     def move_towards_center(self, elapsed):
@@ -98,10 +98,8 @@ class Viewport:
 
     def fit(self, zoom_factor=1):
         self.zoom_factor = zoom_factor
-        self.draw_subject = transform.scale(self.subject, (int(VIEWPORT_SIZE * self.zoom_factor),
-                                                           int(VIEWPORT_SIZE * self.zoom_factor)))
-        self.center = ((self.draw_subject.get_width() - VIEWPORT_SIZE) / 2,
-                       (self.draw_subject.get_height() - VIEWPORT_SIZE) / 2)
+        self.subject_size = int(VIEWPORT_SIZE * self.zoom_factor)
+        self.center = ((self.subject_size - VIEWPORT_SIZE) / 2, (self.subject_size - VIEWPORT_SIZE) / 2)
         self.subject_location[0] = self.center[0]
         self.subject_location[1] = self.center[1]
 
@@ -114,41 +112,125 @@ class Viewport:
 
     def convert_mouse_pos(self, mouse_pos):
         mouse_pos = (mouse_pos[0] - self.location[0], mouse_pos[1] - self.location[1])
-        mouse_pos = (((mouse_pos[0] + self.subject_location[0]) / self.draw_subject.get_width())
-                     * self.initial_subject_size[0],
-                     ((mouse_pos[1] + self.subject_location[1]) / self.draw_subject.get_height())
-                     * self.initial_subject_size[1])
+        mouse_pos = (((mouse_pos[0] + self.subject_location[0]) / self.subject_size) * self.initial_subject_size[0],
+                     ((mouse_pos[1] + self.subject_location[1]) / self.subject_size) * self.initial_subject_size[1])
 
         return mouse_pos
 
     def deconvert_mouse_pos(self, coordinates):
         x_pos = coordinates[0] / self.initial_subject_size[0]
-        x_pos *= self.draw_subject.get_width()
+        x_pos *= self.subject_size
         x_pos -= self.subject_location[0]
         x_pos += self.location[0]
 
         y_pos = coordinates[1] / self.initial_subject_size[1]
-        y_pos *= self.draw_subject.get_height()
+        y_pos *= self.subject_size
         y_pos -= self.subject_location[1]
         y_pos += self.location[1]
 
         return int(x_pos), int(y_pos)
 
-    def update(self, elapsed, dx, dy):
+    def update(self, elapsed, dx, dy, repaint=True):
         self.move(elapsed, dx, dy)
 
         if self.moving_towards_center:
             self.move_towards_center(elapsed)
 
-    def update_subject(self, updated_subject):
-        self.subject = updated_subject
-        self.draw_subject = self.subject
-        self.center = ((self.draw_subject.get_width() - VIEWPORT_SIZE) / 2,
-                       (self.draw_subject.get_height() - VIEWPORT_SIZE) / 2)
-        self.subject_location[0] = self.center[0]
-        self.subject_location[1] = self.center[1]
+        if repaint:
+            self.renderer.update()
+
+    def refresh(self, area=None):
+        self.renderer.invalidate(area)
+
+    def visible_tiles(self, level, left, top, size):
+        tile_size = self.renderer.tile_size
+        tile_count = self.renderer.tile_count(level)
+
+        for tx in range(max(0, left // tile_size), min(tile_count, (left + size - 1) // tile_size + 1)):
+            for ty in range(max(0, top // tile_size), min(tile_count, (top + size - 1) // tile_size + 1)):
+                yield tx, ty, (tx * tile_size - left, ty * tile_size - top)
+
+    def draw(self, surface):
+        level, level_size = self.renderer.level_for(self.subject_size)
+        scale = level_size / self.subject_size
+
+        if level_size == self.subject_size:
+            window = self.surface
+        else:
+            window = Surface((int(VIEWPORT_SIZE * scale) + 1, int(VIEWPORT_SIZE * scale) + 1))
+
+        window.fill((0, 0, 0))
+        for tx, ty, position in self.visible_tiles(level, int(self.subject_location[0] * scale),
+                                                   int(self.subject_location[1] * scale), window.get_width()):
+            window.blit(self.renderer.request(level, tx, ty), position)
+
+        if window is not self.surface:
+            self.surface.blit(transform.smoothscale(window, (VIEWPORT_SIZE, VIEWPORT_SIZE)), (0, 0))
+        surface.blit(self.surface, self.location)
+
+
+class LabelRenderer:
+    def __init__(self, cache_size=LABEL_CACHE_SIZE):
+        self.cache_size = cache_size
+
+        self.fonts = {}
+        self.labels = OrderedDict()
+
+    def get_font(self, size):
+        if size not in self.fonts:
+            if not font.get_init():
+                font.init()
+            self.fonts[size] = font.SysFont(LABEL_FONT, size)
+        return self.fonts[size]
+
+    def render(self, text, size, color):
+        key = (text, size, color)
+        label = self.labels.get(key)
+        if label is None:
+            label = self.get_font(size).render(text, 1, color)
+            self.labels[key] = label
+            if len(self.labels) > self.cache_size:
+                self.labels.popitem(last=False)
+        else:
+            self.labels.move_to_end(key)
+        return label
+
+    def draw(self, surface, text, size, color, center):
+        label = self.render(text, size, color)
+        surface.blit(label, (center[0] - label.get_width() // 2, center[1] - label.get_height() // 2))
+
+
+labels = LabelRenderer()
+
+
+class ChunkViewport:
+    def __init__(self, renderer, location):
+        self.location = location
+
+        self.renderer = renderer
+        self.subject_location = [0.0, 0.0]
+        self.zoom_factor = 1
+
+        self.surface = Surface((VIEWPORT_SIZE, VIEWPORT_SIZE))
+
+    @property
+    def scale(self):
+        return VIEWPORT_SIZE * self.zoom_factor / MAP_SIZE
+
+    def move(self, elapsed, dx, dy):
+        self.subject_location[0] += dx * VIEWPORT_MOVING_SPEED * elapsed
+        self.subject_location[1] += dy * VIEWPORT_MOVING_SPEED * elapsed
+
+    def zoom(self, zoom_factor):
+        center = ((self.subject_location[0] + VIEWPORT_SIZE / 2) / self.scale,
+                  (self.subject_location[1] + VIEWPORT_SIZE / 2) / self.scale)
+        self.zoom_factor = max(1, min(self.zoom_factor * zoom_factor, VIEWPORT_MAX_ZOOM))
+        self.subject_location = [center[0] * self.scale - VIEWPORT_SIZE / 2,
+                                 center[1] * self.scale - VIEWPORT_SIZE / 2]
+
+    def update(self, elapsed, dx, dy):
+        self.move(elapsed, dx, dy)
 
     def draw(self, surface):
-        self.surface.blit(self.draw_subject, (0, 0), (self.subject_location[0], self.subject_location[1],
-                                                      self.surface.get_width(), self.surface.get_height()))
+        self.renderer.paint(self.surface, (int(self.subject_location[0]), int(self.subject_location[1])), self.scale)
         surface.blit(self.surface, self.location)
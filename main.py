@@ -1,9 +1,11 @@
-from pygame import display, event, transform, mouse, time, font, draw
+from pygame import display, event, mouse, time, font, draw
 import pygame
 
-from gui import Viewport, Button
+from gui import Viewport, Button, labels
 from Geography import Geography
-from config import SCREEN_HEIGHT, SCREEN_WIDTH, MAP_SIZE
+from Renderer import TileRenderer
+from Worker import Worker, GeographyJob
+from config import SCREEN_HEIGHT, SCREEN_WIDTH
 
 display.init()
 font.init()
@@ -11,47 +13,62 @@ screen = display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
 clock = time.Clock()
 
 geo = Geography()
-viewport = Viewport(transform.scale(geo.surface, (MAP_SIZE, MAP_SIZE)), (200, 0))
+viewport = Viewport(TileRenderer(geo), (200, 0))
+geo.mark_drawn()
+worker = Worker()
 
 is_creating_landmass = False
 land_mass_origin = (0, 0)
 is_setting_landmass_distance = False
 
 
-def finalize(v, g):
-    g.finalize()
-    g.draw()
+def redraw(v, job):
+    if job.area is not None:
+        v.refresh(job.area)
 
-    v.update_subject(g.surface)
-    v.fit()
 
+def finalize(v, g):
+    worker.submit(GeographyJob('Finalizing', g, 'finalize'))
 
-def unfinalize(v, g):
-    g.unfinalize()
-    g.draw()
 
-    v.update_subject(g.surface)
-    v.fit()
+def unfinalize(v, g):
+    worker.submit(GeographyJob('Unfinalizing', g, 'unfinalize'))
 
 
 def create_surface(v, g):
     global is_creating_landmass
 
-    unfinalize(v, g)
     is_creating_landmass = True
 
 
 def reset_land(v, g):
-    g.reset()
-    g.draw()
+    worker.submit(GeographyJob('Resetting', g, 'reset'))
+
+
+def undo(v, g):
+    worker.submit(GeographyJob('Undoing', g, 'undo'))
 
-    v.update_subject(g.surface)
-    v.fit()
+
+def redo(v, g):
+    worker.submit(GeographyJob('Redoing', g, 'redo'))
+
+
+def draw_status(surface):
+    status = worker.status()
+    if status is not None:
+        label, stage, progress, waiting = status
+        text = '%s: %s (%d%%)' % (label, stage, progress * 100)
+        if waiting > 0:
+            text += ', %d queued' % waiting
+        labels.draw(surface, text, 18, (255, 255, 255), (100, SCREEN_HEIGHT - 40))
+        labels.draw(surface, 'Esc to cancel', 18, (255, 255, 255), (100, SCREEN_HEIGHT - 20))
 
 create_landmass_button = Button((0, 0), 'Create Landmass', create_surface, [viewport, geo])
 finalize_button = Button((0, 50), 'Finalize Landmass', finalize, [viewport, geo])
 unfinalize_button = Button((0, 100), 'Unfinalize Landmass', unfinalize, [viewport, geo])
 reset_land_button = Button((0, 150), 'Reset Landmass', reset_land, [viewport, geo])
+undo_button = Button((0, 200), 'Undo', undo, [viewport, geo])
+redo_button = Button((0, 250), 'Redo', redo, [viewport, geo])
 
 keys = set()
 game_over = False
@@ -63,7 +80,9 @@ while not game_over:
             game_over = True
         elif curr_event.type == pygame.KEYDOWN:
             if curr_event.key == pygame.K_ESCAPE:
-                if is_setting_landmass_distance or is_creating_landmass:
+                if worker.busy:
+                    worker.cancel()
+                elif is_setting_landmass_distance or is_creating_landmass:
                     is_setting_landmass_distance = False
                     is_creating_landmass = False
                 else:
@@ -88,10 +107,7 @@ while not game_over:
                 is_setting_landmass_distance = False
                 distance = ((mouse_pos[0] - land_mass_origin[0]) ** 2 +
                             (mouse_pos[1] - land_mass_origin[1]) ** 2) ** 0.5
-                geo.create_land(land_mass_origin, distance)
-                geo.draw()
-                viewport.update_subject(geo.surface)
-                viewport.fit()
+                worker.submit(GeographyJob('Creating landmass', geo, 'create_land', land_mass_origin, distance))
 
     dx = dy = 0
     if pygame.K_LEFT in keys:
@@ -103,11 +119,16 @@ while not game_over:
     if pygame.K_UP in keys:
         dy = -1
 
-    viewport.update(elapsed, dx, dy)
+    for job in worker.finished():
+        redraw(viewport, job)
+
+    viewport.update(elapsed, dx, dy, repaint=not worker.busy)
     create_landmass_button.update(elapsed, mouse.get_pos(), any(mouse.get_pressed()))
     finalize_button.update(elapsed, mouse.get_pos(), any(mouse.get_pressed()))
     unfinalize_button.update(elapsed, mouse.get_pos(), any(mouse.get_pressed()))
     reset_land_button.update(elapsed, mouse.get_pos(), any(mouse.get_pressed()))
+    undo_button.update(elapsed, mouse.get_pos(), any(mouse.get_pressed()))
+    redo_button.update(elapsed, mouse.get_pos(), any(mouse.get_pressed()))
 
     screen.fill((0, 0, 0))
 
@@ -117,6 +138,8 @@ while not game_over:
     finalize_button.draw(screen)
     unfinalize_button.draw(screen)
     reset_land_button.draw(screen)
+    undo_button.draw(screen)
+    redo_button.draw(screen)
 
     if is_creating_landmass:
         draw.circle(screen, (255, 0, 0), mouse.get_pos(), 5)
@@ -128,7 +151,11 @@ while not game_over:
         draw.circle(screen, (255, 0, 0), converted_origin, 5)
         draw.circle(screen, (255, 0, 0), converted_origin, max(5, int(distance)), 2)
 
+    draw_status(screen)
+
     display.flip()
 
+worker.stop(timeout=5)
+
 display.quit()
 font.quit()